@@ -0,0 +1,58 @@
+'''Compares an initial sync delivered as one added event per item with a bulk subscription delivering a single batch event.
+
+The time measured runs from subscribing until a consumer has handled every event the sync produced, and then from unsubscribing until the removals have been handled.
+
+Run from the repository root:
+    python -m benchmarks.bench_bulk_sync [documents]
+'''
+
+import asyncio
+import sys
+import time
+
+from ddp_asyncio import DDPClient
+
+from .fake_server import FakeDDPServer
+
+def items(count):
+    return [('items', 'item{}'.format(i), {'title': 'Item {}'.format(i), 'n': i, 'tags': ['a', 'b']}) for i in range(count)]
+
+async def consume(queue, count, key):
+    handled = 0
+    while handled < count:
+        event = await queue.get()
+        handled += len(event[key]) if event.type == 'batch' else 1
+
+async def run(url, count, bulk):
+    client = DDPClient(url)
+    await client.connect()
+    
+    queue = client.get_collection('items').get_queue()
+    
+    started = time.perf_counter()
+    sub = await client.subscribe('items', count, bulk = bulk)
+    await sub.wait()
+    await consume(queue, count, 'added')
+    synced = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    await client.unsubscribe(sub)
+    await consume(queue, count, 'removed')
+    removed = time.perf_counter() - started
+    
+    await client.disconnect()
+    
+    return synced, removed
+
+async def main(count):
+    server = FakeDDPServer(publications = {'items': items})
+    await server.start()
+    
+    for bulk in (False, True):
+        synced, removed = await run(server.url, count, bulk)
+        print('{} documents, {}: synced and consumed in {:.2f} s, removed and consumed in {:.2f} s'.format(count, 'bulk' if bulk else 'per item', synced, removed))
+    
+    await server.stop()
+
+if __name__ == '__main__':
+    asyncio.get_event_loop().run_until_complete(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000))
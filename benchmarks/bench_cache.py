@@ -0,0 +1,67 @@
+'''Compares a cold start with a warm start from a Collection cache.
+
+On a warm start the items are loaded from the cache before connecting, and the server's initial sync only produces events for items which actually changed.
+The times measured run from creating the client until its data is available, and until the subscription is ready and every event has been consumed.
+
+Run from the repository root:
+    python -m benchmarks.bench_cache [documents] [changed documents]
+'''
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from ddp_asyncio import DDPClient
+
+from .fake_server import FakeDDPServer
+
+async def run(url, path):
+    started = time.perf_counter()
+    
+    client = DDPClient(url, cache = path)
+    queue = client.get_collection('items').get_queue()
+    
+    await client.connect()
+    available = time.perf_counter() - started
+    
+    sub = await client.subscribe('items')
+    await sub.wait()
+    
+    events = 0
+    while not queue.empty():
+        queue.get_nowait()
+        events += 1
+    
+    ready = time.perf_counter() - started
+    
+    await client.disconnect()
+    client._cache.close()
+    
+    return available, ready, events
+
+async def main(count, changed):
+    version = [0]
+    
+    def items():
+        return [('items', 'item{}'.format(i), {'title': 'Item {}'.format(i), 'n': i, 'version': version[0] if i < changed else 0}) for i in range(count)]
+    
+    server = FakeDDPServer(publications = {'items': items})
+    await server.start()
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'cache.db')
+        
+        for name in ('cold', 'warm'):
+            available, ready, events = await run(server.url, path)
+            print('{} documents, {} start: data available after {:.2f} s, ready and consumed after {:.2f} s, {} events'.format(count, name, available, ready, events))
+            version[0] += 1
+    
+    await server.stop()
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    changed = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    
+    asyncio.get_event_loop().run_until_complete(main(count, changed))
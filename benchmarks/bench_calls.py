@@ -0,0 +1,63 @@
+'''Measures method call throughput and latency against a local fake DDP server.
+
+Run from the repository root:
+    python -m benchmarks.bench_calls [total calls] [concurrent calls]
+'''
+
+import asyncio
+import sys
+import time
+
+from ddp_asyncio import DDPClient
+from ddp_asyncio.heartbeat import percentile
+
+from .fake_server import FakeDDPServer
+
+async def run(total, concurrency):
+    server = FakeDDPServer({'echo': lambda *params: params})
+    await server.start()
+    
+    client = DDPClient(server.url)
+    await client.connect()
+    
+    latencies = []
+    
+    async def worker(count):
+        for i in range(count):
+            start = time.perf_counter()
+            await client.call('echo', i)
+            latencies.append(time.perf_counter() - start)
+    
+    # The calls left over after dividing them evenly go to the first workers, one each.
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(total // concurrency + (i < total % concurrency)) for i in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    
+    await client.disconnect()
+    await server.stop()
+    
+    if not latencies:
+        return {'calls': 0, 'concurrency': concurrency, 'calls_per_second': 0, 'p50_ms': None, 'p99_ms': None}
+    
+    return {
+        'calls': len(latencies),
+        'concurrency': concurrency,
+        'calls_per_second': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000
+    }
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    
+    result = asyncio.get_event_loop().run_until_complete(run(total, concurrency))
+    
+    if not result['calls']:
+        print('No calls made.')
+        return
+    
+    print('{calls} calls, {concurrency} concurrent: {calls_per_second:.0f} calls/s, p50 {p50_ms:.2f} ms, p99 {p99_ms:.2f} ms'.format(**result))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+'''Compares computing before/after diffs of changed items in a consumer, by copying each item before it changes, with Collections recording diffs.
+
+Run from the repository root:
+    python -m benchmarks.bench_changes [items] [changes]
+'''
+
+import copy
+import random
+import sys
+import time
+
+from ddp_asyncio.collection import Collection
+
+def document(i):
+    return {
+        'title': 'Item {}'.format(i),
+        'owner': {'_id': 'user{}'.format(i % 100), 'name': 'User {}'.format(i % 100), 'roles': ['admin', 'editor']},
+        'counts': {'views': i, 'likes': i // 3},
+        'tags': ['a', 'b', 'c'],
+        'done': False
+    }
+
+def changes(items, count):
+    rng = random.Random(1)
+    return [('item{}'.format(rng.randrange(items)), {'counts': {'views': i, 'likes': i // 3}, 'done': i % 2 == 0}, ['tags'] if i % 10 == 0 else []) for i in range(count)]
+
+def run(items, messages, compact, diffs):
+    col = Collection('items', compact, diffs)
+    for i in range(items):
+        col.__added__('item{}'.format(i), document(i))
+    
+    queue = col.get_queue()
+    while not queue.empty(): queue.get_nowait()
+    
+    started = time.perf_counter()
+    
+    for _id, fields, cleared in messages:
+        if not diffs:
+            # What a consumer has to do without diffs: keep a copy of the item from before the change.
+            _ = copy.deepcopy(col[_id])
+        
+        col.__changed__(_id, dict(fields), cleared)
+        event = queue.get_nowait()
+        
+        if diffs:
+            _ = event.before, event.after
+    
+    return len(messages) / (time.perf_counter() - started)
+
+def main():
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    messages = changes(items, count)
+    
+    for compact in (False, True):
+        for diffs in (False, True):
+            rate = run(items, messages, compact, diffs)
+            print('{} mode, {}: {:.0f} changes/s'.format('compact' if compact else 'default', 'recorded diffs' if diffs else 'deep copy', rate))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+'''Compares the message codecs on a stream of realistic DDP traffic.
+
+Run from the repository root:
+    python -m benchmarks.bench_codec [number of frames]
+'''
+
+import datetime
+import json
+import random
+import sys
+import time
+
+from ddp_asyncio.codec import codecs
+
+def make_traffic(count):
+    '''Builds a mix of added, changed, ready and result frames, about 5% of which contain EJSON dates.'''
+    
+    frames = []
+    
+    for i in range(count):
+        kind = random.random()
+        
+        if kind < 0.6:
+            msg = {'msg': 'added', 'collection': 'todos', 'id': 'todo{}'.format(i), 'fields': {
+                'listId': 'list{}'.format(i % 100),
+                'text': 'Todo number {}'.format(i),
+                'checked': bool(i % 2),
+                'tags': ['work', 'home'][:i % 3],
+                'owner': {'name': 'user{}'.format(i % 50), 'roles': ['member']}
+            }}
+        elif kind < 0.9:
+            msg = {'msg': 'changed', 'collection': 'todos', 'id': 'todo{}'.format(i), 'fields': {'checked': True}, 'cleared': []}
+        elif kind < 0.95:
+            msg = {'msg': 'ready', 'subs': [str(i)]}
+        else:
+            msg = {'msg': 'result', 'id': str(i), 'result': {'createdAt': {'$date': 1500000000000 + i}}}
+        
+        frames.append(json.dumps(msg))
+    
+    return frames
+
+def bench(codec, frames):
+    start = time.perf_counter()
+    messages = [codec.loads(f) for f in frames]
+    decode = time.perf_counter() - start
+    
+    # Outgoing frames are encoded from Python values, so the dates are converted back to datetimes first.
+    outgoing = [{'msg': 'method', 'method': 'todos.insert', 'id': str(i), 'params': [m]} for i, m in enumerate(messages)]
+    for m in outgoing[::20]: m['params'].append(datetime.datetime.now(datetime.timezone.utc))
+    
+    start = time.perf_counter()
+    for m in outgoing: codec.dumps(m)
+    encode = time.perf_counter() - start
+    
+    return decode, encode
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    frames = make_traffic(count)
+    
+    for name, cls in sorted(codecs.items()):
+        try:
+            codec = cls()
+        except ImportError as e:
+            print('{:8} skipped: {}'.format(name, e))
+            continue
+        
+        decode, encode = bench(codec, frames)
+        print('{:8} decode {:>9.0f} frames/s   encode {:>9.0f} frames/s'.format(name, count / decode, count / encode))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+'''Compares memory use and load throughput of the default and compact Collection storage modes.
+
+Each run loads a publication of freshly decoded documents into a Collection, as the client does during an initial sync.
+
+Run from the repository root:
+    python -m benchmarks.bench_collection_storage [number of documents]
+'''
+
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+from ddp_asyncio.collection import Collection
+
+def make_frames(count):
+    return [json.dumps({
+        'listId': 'list{}'.format(i % 1000),
+        'text': 'Todo number {}'.format(i),
+        'checked': bool(i % 2),
+        'createdAt': 1500000000000 + i,
+        'tags': ['work', 'home'],
+        'owner': {'name': 'user{}'.format(i % 50), 'profile': {'roles': ['member'], 'locale': 'en'}}
+    }) for i in range(count)]
+
+def load(frames, compact, measure_memory):
+    col = Collection('todos', compact)
+    
+    # A queue which is drained as events arrive, so event construction is included but events are not retained.
+    q = col.get_queue()
+    
+    gc.collect()
+    if measure_memory: tracemalloc.start()
+    start = time.perf_counter()
+    
+    for i, frame in enumerate(frames):
+        col.__added__('todo{}'.format(i), json.loads(frame))
+        q.get_nowait()
+    
+    elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0] if measure_memory else None
+    if measure_memory: tracemalloc.stop()
+    
+    return col, elapsed, memory
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    frames = make_frames(count)
+    
+    for compact in (False, True):
+        col, elapsed, _ = load(frames, compact, False)
+        del col
+        col, _, memory = load(frames, compact, True)
+        del col
+        
+        print('{:8} {:>8.0f} docs/s   {:>7.1f} MiB   {:>5.0f} bytes/doc'.format(
+            'compact' if compact else 'default', count / elapsed, memory / 1048576, memory / count))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+'''Compares bytes on the wire and client CPU time of an initial sync with and without permessage-deflate compression, and with smaller compression windows.
+
+The fake server runs in its own process, so the CPU time measured is the client's alone. The link is local and fast, so the transfer time on a slower link
+is estimated from the bytes received.
+
+Run from the repository root:
+    python -m benchmarks.bench_compression [documents] [link speed in Mbit/s]
+'''
+
+import asyncio
+import multiprocessing
+import sys
+import time
+
+from ddp_asyncio import DDPClient
+
+from .bench_ingest import serve
+
+async def sync(url, count, options):
+    client = DDPClient(url, codec = 'json', compact_collections = True, **options)
+    await client.connect()
+    
+    # Count the bytes received over the connection, frame headers included.
+    websocket = client._websocket
+    data_received = websocket.data_received
+    received = 0
+    
+    def counted(data):
+        nonlocal received
+        received += len(data)
+        data_received(data)
+    
+    websocket.data_received = counted
+    
+    started, cpu_started = time.perf_counter(), time.process_time()
+    sub = await client.subscribe('items', count)
+    await sub.wait()
+    elapsed, cpu = time.perf_counter() - started, time.process_time() - cpu_started
+    
+    assert len(client.get_collection('items')) == count
+    await client.disconnect()
+    
+    return {'bytes': received, 'seconds': elapsed, 'cpu_seconds': cpu}
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    link = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    
+    port = multiprocessing.Value('i', 0)
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target = serve, args = (port, ready), daemon = True)
+    server.start()
+    ready.wait()
+    
+    url = 'ws://127.0.0.1:{}/websocket'.format(port.value)
+    
+    configurations = (
+        ('uncompressed', {'compression': None}),
+        ('deflate, default window (15 bits with this server)', {}),
+        ('deflate, 10 window bits', {'compression_window_bits': 10}),
+        ('deflate, 9 window bits', {'compression_window_bits': 9})
+    )
+    
+    try:
+        for name, options in configurations:
+            result = asyncio.run(sync(url, count, options))
+            transfer = result['bytes'] * 8 / (link * 1000000)
+            
+            print('{} documents, {}: {:.1f} MB received, client CPU {cpu_seconds:.2f} s, synced in {seconds:.2f} s locally, {:.1f} s of transfer at {} Mbit/s'.format(
+                count, name, result['bytes'] / 1000000, transfer, link, **result))
+    
+    finally:
+        server.terminate()
+
+if __name__ == '__main__':
+    main()
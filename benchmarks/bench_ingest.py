@@ -0,0 +1,93 @@
+'''Measures how long the event loop is blocked while a client receives a large initial sync.
+
+The fake server runs in its own process and publishes the requested number of documents. While the client receives them, a ticker coroutine sleeps for 1 ms at a time
+and records how late it wakes up, which is how long other coroutines would have been kept waiting.
+
+Run from the repository root:
+    python -m benchmarks.bench_ingest [documents]
+'''
+
+import asyncio
+import multiprocessing
+import sys
+import time
+
+from ddp_asyncio import DDPClient
+from ddp_asyncio.heartbeat import percentile
+
+from .fake_server import FakeDDPServer
+
+def document(i):
+    return ('items', 'item{}'.format(i), {
+        'title': 'Item number {}'.format(i),
+        'createdAt': {'$date': 1500000000000 + i},
+        'owner': {'_id': 'user{}'.format(i % 100), 'name': 'User {}'.format(i % 100)},
+        'tags': ['tag{}'.format(i % 7), 'tag{}'.format(i % 11)],
+        'counts': {'views': i, 'likes': i // 3, 'shares': i // 7},
+        'done': i % 2 == 0
+    })
+
+def serve(port, ready):
+    async def main():
+        server = FakeDDPServer(publications = {'items': lambda count: map(document, range(count))}, port = 0)
+        await server.start()
+        port.value = server.port
+        ready.set()
+        await asyncio.Event().wait()
+    
+    asyncio.run(main())
+
+async def sync(url, count):
+    client = DDPClient(url, codec = 'json', compact_collections = True)
+    await client.connect()
+    
+    lags = []
+    done = False
+    
+    async def ticker():
+        loop = asyncio.get_event_loop()
+        while not done:
+            started = loop.time()
+            await asyncio.sleep(0.001)
+            lags.append(loop.time() - started - 0.001)
+    
+    ticker_task = asyncio.get_event_loop().create_task(ticker())
+    
+    started = time.perf_counter()
+    sub = await client.subscribe('items', count)
+    await sub.wait()
+    elapsed = time.perf_counter() - started
+    
+    done = True
+    await ticker_task
+    
+    assert len(client.get_collection('items')) == count
+    await client.disconnect()
+    
+    return {
+        'sync_seconds': elapsed,
+        'p99_lag_ms': percentile(lags, 99) * 1000,
+        'max_lag_ms': max(lags) * 1000,
+        'blocked_seconds': sum(lag for lag in lags if lag > 0.001)
+    }
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    
+    port = multiprocessing.Value('i', 0)
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target = serve, args = (port, ready), daemon = True)
+    server.start()
+    ready.wait()
+    
+    url = 'ws://127.0.0.1:{}/websocket'.format(port.value)
+    
+    try:
+        result = asyncio.run(sync(url, count))
+        print('{} documents: synced in {sync_seconds:.2f} s, loop lag p99 {p99_lag_ms:.2f} ms, max {max_lag_ms:.2f} ms, {blocked_seconds:.2f} s blocked over 1 ms'.format(count, **result))
+    
+    finally:
+        server.terminate()
+
+if __name__ == '__main__':
+    main()
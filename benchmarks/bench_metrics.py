@@ -0,0 +1,59 @@
+'''Measures the cost of instrumentation by syncing the same publication with metrics disabled, enabled, and enabled with hooks.
+
+Run from the repository root:
+    python -m benchmarks.bench_metrics [number of documents] [repetitions]
+'''
+
+import asyncio
+import sys
+import time
+
+from ddp_asyncio import DDPClient
+from ddp_asyncio.metrics import Metrics
+
+from .fake_server import FakeDDPServer
+
+def publication(count):
+    return lambda: [('todos', 'todo{}'.format(i), {'listId': 'list{}'.format(i % 100), 'text': 'Todo {}'.format(i), 'checked': False}) for i in range(count)]
+
+async def sync(url, metrics):
+    client = DDPClient(url, metrics = metrics)
+    await client.connect()
+    
+    start = time.perf_counter()
+    sub = await client.subscribe('todos')
+    await sub.wait()
+    elapsed = time.perf_counter() - start
+    
+    await client.disconnect()
+    return elapsed
+
+def with_hooks():
+    metrics = Metrics()
+    for name in ('on_message_received', 'on_message_sent', 'on_call_complete', 'on_collection_event'):
+        metrics.add_hook(name, lambda *args: None)
+    return metrics
+
+async def run(count, repetitions):
+    server = FakeDDPServer(publications = {'todos': publication(count)})
+    await server.start()
+    
+    results = {}
+    for name, factory in (('disabled', lambda: None), ('enabled', Metrics), ('hooks', with_hooks)):
+        results[name] = min([await sync(server.url, factory()) for i in range(repetitions)])
+    
+    await server.stop()
+    return results
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    
+    results = asyncio.get_event_loop().run_until_complete(run(count, repetitions))
+    
+    for name, elapsed in results.items():
+        print('{:9} {:>8.0f} msgs/s   {:>6.2f} us/msg   {:+6.1f}% vs disabled'.format(
+            name, count / elapsed, elapsed / count * 1e6, (elapsed / results['disabled'] - 1) * 100))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+'''Compares keeping an ordered Collection's order, like a leaderboard, with a plain list of _ids which is searched and shifted on each movedBefore message,
+and with the order index of an ordered Collection.
+
+Run from the repository root:
+    python -m benchmarks.bench_ordered [items] [moves]
+'''
+
+import random
+import sys
+import time
+
+from ddp_asyncio.collection import Collection
+
+def moves(items, count):
+    rng = random.Random(2)
+    return [('item{}'.format(rng.randrange(items)), 'item{}'.format(rng.randrange(items))) for i in range(count)]
+
+def collection(items):
+    col = Collection('board')
+    for i in range(items):
+        col.__added_before__('item{}'.format(i), {'score': items - i}, None)
+    
+    return col
+
+def with_list(col, messages):
+    order = list(col)
+    
+    started = time.perf_counter()
+    
+    for _id, before in messages:
+        if _id == before: continue
+        
+        order.remove(_id)
+        order.insert(order.index(before), _id)
+        
+        # Where a leaderboard needs the moved item's rank.
+        _ = order.index(_id)
+    
+    return len(messages) / (time.perf_counter() - started)
+
+def with_index(col, messages):
+    started = time.perf_counter()
+    
+    for _id, before in messages:
+        if _id == before: continue
+        
+        col.__moved_before__(_id, before)
+        _ = col.index(_id)
+    
+    return len(messages) / (time.perf_counter() - started)
+
+def main():
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    messages = moves(items, count)
+    
+    # The list is much slower on large Collections, so it is only timed over a part of the moves.
+    print('{} items, list of _ids: {:.0f} moves/s'.format(items, with_list(collection(items), messages[:count // 20 or 1])))
+    print('{} items, order index: {:.0f} moves/s'.format(items, with_index(collection(items), messages)))
+
+if __name__ == '__main__':
+    main()
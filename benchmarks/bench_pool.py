@@ -0,0 +1,61 @@
+'''Compares method call throughput of a single DDPClient with a DDPClientPool spread over several local fake DDP servers.
+
+Each fake server handles a connection's method calls one at a time with a fixed delay, standing in for a replica's processing time, so a single connection is limited by one server.
+
+Run from the repository root:
+    python -m benchmarks.bench_pool [total calls] [servers] [connections]
+'''
+
+import asyncio
+import sys
+import time
+
+from ddp_asyncio import DDPClient, DDPClientPool
+
+from .fake_server import FakeDDPServer
+
+async def run_calls(client, total, concurrency):
+    async def worker(count):
+        for i in range(count):
+            await client.call('work', i)
+    
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(total // concurrency) for i in range(concurrency)])
+    return total / (time.perf_counter() - start)
+
+async def run(total, server_count, connections):
+    servers = [FakeDDPServer({'work': lambda i: i}, latency = 0.001) for i in range(server_count)]
+    for server in servers: await server.start()
+    
+    client = DDPClient(servers[0].url)
+    await client.connect()
+    single = await run_calls(client, total, 200)
+    await client.disconnect()
+    
+    pool = DDPClientPool([server.url for server in servers], connections)
+    await pool.connect()
+    pooled = await run_calls(pool, total, 200)
+    
+    await pool.disconnect()
+    
+    for server in servers: await server.stop()
+    
+    return {
+        'calls': total,
+        'servers': server_count,
+        'connections': connections,
+        'single_calls_per_second': single,
+        'pool_calls_per_second': pooled
+    }
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    server_count = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    connections = int(sys.argv[3]) if len(sys.argv) > 3 else server_count
+    
+    result = asyncio.get_event_loop().run_until_complete(run(total, server_count, connections))
+    
+    print('{calls} calls: single client {single_calls_per_second:.0f} calls/s, pool of {connections} connections to {servers} servers {pool_calls_per_second:.0f} calls/s'.format(**result))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+'''Measures how fast a subscription's items are received while sending to the server is backed up.
+
+The fake server publishes the requested number of items and sends a ping every 100 items. With a stalled server, it stops reading from the connection
+when the subscription starts, and the client sends several large method calls right after subscribing, so its writes back up. Pongs have to wait
+behind those writes, but handling received messages must not: the items should arrive about as fast as without the stall.
+tests/test_receive.py checks that they do.
+
+Run from the repository root:
+    python -m benchmarks.bench_receive [items] [stall in seconds]
+'''
+
+import asyncio
+import os
+import sys
+import time
+
+from ddp_asyncio import DDPClient
+
+from .fake_server import FakeDDPServer
+
+def document(i):
+    return ('items', 'item{}'.format(i), {'title': 'Item {}'.format(i), 'counts': {'views': i, 'likes': i // 3}, 'done': i % 2 == 0})
+
+async def receive(url, count, backlog):
+    '''Subscribes to count items while backlog calls of 1 MB each are being sent, and returns the items received per second
+    and the number of messages which were still waiting to be sent when the subscription became ready.
+    '''
+    
+    # Compression would shrink the calls too much to back up the connection.
+    client = DDPClient(url, compression = None)
+    await client.connect()
+    
+    started = time.perf_counter()
+    sub = await client.subscribe('items', count)
+    
+    payload = os.urandom(524288).hex()
+    calls = [asyncio.ensure_future(client.call('work', payload)) for i in range(backlog)]
+    
+    await sub.wait()
+    elapsed = time.perf_counter() - started
+    waiting = client.send_queue_depth
+    
+    await asyncio.gather(*calls)
+    await client.disconnect()
+    
+    return {'rate': count / elapsed, 'waiting': waiting}
+
+async def run(count, stall):
+    results = {}
+    
+    for stalled in (False, True):
+        server = FakeDDPServer({'work': len}, {'items': lambda count: map(document, range(count))}, ping_every = 100, stall_reads = stall if stalled else None)
+        await server.start()
+        
+        results[stalled] = await receive(server.url, count, 8 if stalled else 0)
+        
+        await server.stop()
+    
+    return results
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    stall = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    
+    results = asyncio.get_event_loop().run_until_complete(run(count, stall))
+    
+    print('{} items, no stall: {rate:.0f} items/s'.format(count, **results[False]))
+    print('{} items, server stalled for {} s: {rate:.0f} items/s, {waiting} messages waiting to be sent when ready'.format(count, stall, **results[True]))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+'''Measures a burst of subscriptions made with subscribe_many(), and a method call made while the burst is being sent, with queued messages written one at a time and in batches.
+
+A send_batch_size of 1 writes every message with its own write to the connection, as each subscribe() used to.
+8 is the default.
+
+Run from the repository root:
+    python -m benchmarks.bench_send [subscriptions]
+'''
+
+import asyncio
+import sys
+import time
+
+from ddp_asyncio import DDPClient
+
+from .fake_server import FakeDDPServer
+
+async def burst(url, count, batch_size):
+    client = DDPClient(url, send_batch_size = batch_size)
+    await client.connect()
+    
+    # Count the writes made to the connection's transport.
+    transport = client._websocket.transport
+    write = transport.write
+    writes = 0
+    
+    def counted(data):
+        nonlocal writes
+        writes += 1
+        write(data)
+    
+    transport.write = counted
+    
+    started = time.perf_counter()
+    subs = await client.subscribe_many([('item', i) for i in range(count)])
+    
+    call_started = time.perf_counter()
+    await client.call('work', 1)
+    call_latency = time.perf_counter() - call_started
+    
+    await asyncio.gather(*[sub.wait() for sub in subs])
+    elapsed = time.perf_counter() - started
+    
+    await client.disconnect()
+    
+    return {'seconds': elapsed, 'call_ms': call_latency * 1000, 'writes': writes}
+
+async def run(count):
+    server = FakeDDPServer({'work': lambda i: i}, {'item': lambda i: [('items', 'item{}'.format(i), {'n': i})]})
+    await server.start()
+    
+    results = {}
+    for batch_size in (1, 8, 64):
+        results[batch_size] = await burst(server.url, count, batch_size)
+    
+    await server.stop()
+    return results
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    
+    results = asyncio.get_event_loop().run_until_complete(run(count))
+    
+    for batch_size, result in results.items():
+        print('{} subscriptions, send_batch_size {}: all ready in {seconds:.2f} s, {writes} writes, call made during the burst returned in {call_ms:.1f} ms'.format(count, batch_size, **result))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+'''Measures how long a method call's write takes to show up in a Collection, with and without a client-side stub, against a server with a round trip latency.
+
+Without a stub the item only appears once the server publishes it. With a stub it appears as soon as call() is made, and the server's version replaces it once the method's writes are confirmed.
+
+Run from the repository root:
+    python -m benchmarks.bench_stubs [calls] [latency]
+'''
+
+import asyncio
+import sys
+import time
+
+from ddp_asyncio import DDPClient
+
+from .fake_server import FakeDDPServer
+
+def insert_todo(stub, _id, title):
+    stub.insert('todos', _id, {'title': title})
+
+async def measure(url, calls, stubbed):
+    client = DDPClient(url)
+    await client.connect()
+    
+    todos = client.get_collection('todos')
+    if stubbed: client.stub('insertTodo', insert_todo)
+    
+    visible, completed = [], []
+    
+    for i in range(calls):
+        _id = 'todo{}'.format(i)
+        q = todos.get_queue(ids = {_id}, types = ('added',))
+        
+        started = time.perf_counter()
+        call = asyncio.ensure_future(client.call('insertTodo', _id, 'Todo {}'.format(i)))
+        
+        await q.get()
+        visible.append(time.perf_counter() - started)
+        
+        await call
+        completed.append(time.perf_counter() - started)
+    
+    await client.disconnect()
+    
+    return {'visible_ms': sum(visible) / calls * 1000, 'completed_ms': sum(completed) / calls * 1000}
+
+async def run(calls, latency):
+    todos = {}
+    
+    def insert(_id, title):
+        todos[_id] = title
+        
+        # Publish the item the way a Meteor server would, from its own write.
+        for websocket in server.connections:
+            asyncio.ensure_future(server.__send__(websocket, {'msg': 'added', 'collection': 'todos', 'id': _id, 'fields': {'title': title}}))
+        
+        return _id
+    
+    server = FakeDDPServer({'insertTodo': insert}, latency = latency)
+    await server.start()
+    
+    results = {}
+    for stubbed in (False, True):
+        results[stubbed] = await measure(server.url, calls, stubbed)
+    
+    await server.stop()
+    return results
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.15
+    
+    results = asyncio.get_event_loop().run_until_complete(run(calls, latency))
+    
+    for stubbed, result in results.items():
+        print('{} calls with {:.0f} ms latency, {}: item visible after {visible_ms:.2f} ms, call complete after {completed_ms:.1f} ms'.format(
+            calls, latency * 1000, 'with stub' if stubbed else 'without stub', **result))
+
+if __name__ == '__main__':
+    main()
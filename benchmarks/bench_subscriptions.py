@@ -0,0 +1,70 @@
+'''Measures what the server has to do when many parts of an application subscribe to the same few publications, and keep unsubscribing and subscribing again.
+
+Each of components subscribes to one of tenants publications, then every component unsubscribes and subscribes again, as happens when views are closed and reopened.
+Identical subscriptions are shared, and sub_linger keeps a subscription through the gap between unsubscribing and subscribing again.
+Without sharing, the server would run a subscription and publish its items for every subscribe() call.
+
+Run from the repository root:
+    python -m benchmarks.bench_subscriptions [components] [tenants] [items]
+'''
+
+import asyncio
+import sys
+import time
+
+from ddp_asyncio import DDPClient
+
+from .fake_server import FakeDDPServer
+
+async def churn(url, server, components, tenants, linger):
+    client = DDPClient(url, sub_linger = linger)
+    await client.connect()
+    
+    server.subscriptions = server.published = 0
+    started = time.perf_counter()
+    
+    subs = await client.subscribe_many([('items', i % tenants) for i in range(components)])
+    await asyncio.gather(*[sub.wait() for sub in subs])
+    
+    for sub in subs:
+        await client.unsubscribe(sub)
+    
+    subs = await client.subscribe_many([('items', i % tenants) for i in range(components)])
+    await asyncio.gather(*[sub.wait() for sub in subs])
+    
+    elapsed = time.perf_counter() - started
+    
+    await client.disconnect()
+    
+    return {'seconds': elapsed, 'subscriptions': server.subscriptions, 'items': server.published}
+
+async def run(components, tenants, items):
+    def publish(tenant):
+        server.subscriptions += 1
+        server.published += items
+        return [('items', '{}-{}'.format(tenant, i), {'tenant': tenant, 'n': i}) for i in range(items)]
+    
+    server = FakeDDPServer(publications = {'items': publish})
+    await server.start()
+    
+    results = {}
+    for linger in (0, 1):
+        results[linger] = await churn(server.url, server, components, tenants, linger)
+    
+    await server.stop()
+    return results
+
+def main():
+    components = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    tenants = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    items = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+    
+    results = asyncio.get_event_loop().run_until_complete(run(components, tenants, items))
+    
+    print('{} subscriptions to {} publications, each subscribed twice'.format(components, tenants))
+    print('without sharing: {} server-side subscriptions, {} items published'.format(components * 2, components * 2 * items))
+    for linger, result in results.items():
+        print('sub_linger {}: {subscriptions} server-side subscriptions, {items} items published, {seconds:.2f} s'.format(linger, **result))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+'''Measures MeteorFilesUploader throughput against a local upload endpoint, for different numbers of concurrent chunk uploads.
+
+Run from the repository root:
+    python -m benchmarks.bench_upload [file size in MiB] [per-chunk server latency in ms]
+'''
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from ddp_asyncio import DDPClient
+from ddp_asyncio.extras import MeteorFilesUploader
+
+from .fake_server import FakeDDPServer
+
+async def run(path, size, latency, configurations = ((1, 262144), (1, 1048576), (4, 262144), (4, 1048576), (8, 262144), (8, 1048576))):
+    server = FakeDDPServer(upload_latency = latency)
+    await server.start()
+    
+    client = DDPClient(server.url)
+    await client.connect()
+    
+    results = []
+    
+    for concurrency, chunk_size in configurations:
+        uploader = MeteorFilesUploader(client, 'files', chunk_size = chunk_size, concurrency = concurrency)
+        
+        start = time.perf_counter()
+        upload = uploader.start_upload(path, mimetype = 'application/octet-stream')
+        await upload._upload_task
+        elapsed = time.perf_counter() - start
+        
+        await uploader.close()
+        results.append((concurrency, chunk_size, size / elapsed / 1048576))
+    
+    await client.disconnect()
+    await server.stop()
+    return results
+
+def main():
+    size_mib = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.005
+    
+    with tempfile.NamedTemporaryFile() as f:
+        f.write(os.urandom(size_mib * 1048576))
+        f.flush()
+        
+        results = asyncio.get_event_loop().run_until_complete(run(f.name, size_mib * 1048576, latency))
+    
+    for concurrency, chunk_size, throughput in results:
+        print('concurrency {:2}  chunk {:>5} KiB  {:>7.1f} MiB/s'.format(concurrency, chunk_size // 1024, throughput))
+
+if __name__ == '__main__':
+    main()
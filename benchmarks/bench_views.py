@@ -0,0 +1,68 @@
+'''Compares keeping a filtered, sorted top-N list and per-group counts up to date by scanning the Collection after each change, with views which are updated incrementally.
+
+Run from the repository root:
+    python -m benchmarks.bench_views [items] [changes]
+'''
+
+import random
+import sys
+import time
+
+from ddp_asyncio.collection import Collection
+
+def document(rng, i):
+    return {'score': rng.randrange(1000000), 'group': 'group{}'.format(i % 50), 'active': i % 3 != 0}
+
+def changes(items, count):
+    rng = random.Random(2)
+    return [('item{}'.format(rng.randrange(items)), {'score': rng.randrange(1000000), 'active': rng.random() < 0.7}) for i in range(count)]
+
+def collection(items):
+    rng = random.Random(1)
+    col = Collection('items')
+    for i in range(items):
+        col.__added__('item{}'.format(i), document(rng, i))
+    
+    return col
+
+def rescan(col, messages):
+    started = time.perf_counter()
+    
+    for _id, fields in messages:
+        col.__changed__(_id, dict(fields), [])
+        
+        _ = sorted((doc for doc in col.values() if doc['active']), key = lambda doc: -doc['score'])[:10]
+        counts = {}
+        for doc in col.values():
+            if doc['active']: counts[doc['group']] = counts.get(doc['group'], 0) + 1
+    
+    return len(messages) / (time.perf_counter() - started)
+
+def incremental(col, messages):
+    top = col.view({'active': True}, sort = [('score', -1)], limit = 10)
+    counts = col.group_by('group', filter = {'active': True}).count()
+    
+    started = time.perf_counter()
+    
+    for _id, fields in messages:
+        col.__changed__(_id, dict(fields), [])
+    
+    rate = len(messages) / (time.perf_counter() - started)
+    
+    # The views are only weakly referenced by the Collection, so they are kept until here.
+    top.close()
+    counts.close()
+    
+    return rate
+
+def main():
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    messages = changes(items, count)
+    
+    # Rescanning is much slower, so it is only timed over a part of the changes.
+    print('{} items, rescan after each change: {:.0f} changes/s'.format(items, rescan(collection(items), messages[:count // 100 or 1])))
+    print('{} items, incremental views: {:.0f} changes/s'.format(items, incremental(collection(items), messages)))
+
+if __name__ == '__main__':
+    main()
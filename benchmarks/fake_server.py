@@ -0,0 +1,265 @@
+'''A minimal in-process DDP server which the benchmarks run against, with a Meteor-Files upload endpoint on the same port.
+
+Methods are registered as plain functions in the methods dictionary, their return value is sent back as the method's result.
+If latency is set, the server waits that many seconds before answering each method call, and handles a connection's messages one at a time in the meantime.
+Publications are registered as functions in the publications dictionary, returning a list of (collection, id, fields) tuples which are sent as added messages.
+Like Meteor's merge box, each connection is sent an item once however many of its subscriptions publish it, and removed only once no subscription publishes it anymore.
+
+Streams are registered as functions in the streams dictionary, returning an iterable of added, changed and removed messages which are sent once the subscription is ready,
+at rate messages per second, or as fast as possible if rate is None. Streamed messages are sent as they are, without going through the merge box.
+random_stream() generates a randomized stream, and load_script() reads a recorded one from a file with one JSON message per line.
+
+If ping_every is set, the server sends a ping after every ping_every published items; the number of pongs received on a connection is kept as its pongs attribute.
+
+If stall_reads is set, the server stops reading from a connection for that many seconds whenever a subscription starts, as if it were backed up,
+while it keeps publishing. Once the socket buffers are full, whatever the client sends in the meantime backs up on the client's side.
+
+Calls to _FilesCollectionStart_ methods are answered like Meteor-Files does, pointing uploads at the /cdn/storage/upload route served alongside the websocket.
+The server waits upload_latency seconds before answering each chunk. Uploaded files are kept in the files dictionary, mapping each fileId to the sizes of its chunks
+and to 'eof' once the upload is finished, along with the 'size' and 'length' sent with the last request of a stream. bytes_received counts the bytes of every chunk.
+If keep_uploads is True, the decoded contents of each chunk are also kept in the uploads dictionary, mapping each fileId to its chunks by chunk number.
+'''
+
+import asyncio
+import base64
+import itertools
+import json
+import random
+
+import aiohttp
+from aiohttp import web
+
+def random_stream(collection, count, items = 1000, seed = 0):
+    '''Returns a list of count randomized messages for a collection of up to items items.
+    
+    Items which do not exist yet are added, and existing ones are changed or, one time in ten, removed, so the stream is valid as a whole.
+    Every message causes exactly one CollectionEvent on the client.
+    '''
+    
+    rng = random.Random(seed)
+    existing = set()
+    messages = []
+    
+    for i in range(count):
+        _id = 'item{}'.format(rng.randrange(items))
+        
+        if _id not in existing:
+            existing.add(_id)
+            messages.append({'msg': 'added', 'collection': collection, 'id': _id, 'fields': {
+                'title': 'Item {}'.format(_id),
+                'value': i,
+                'owner': {'_id': 'user{}'.format(i % 100), 'name': 'User {}'.format(i % 100)},
+                'tags': ['tag{}'.format(i % 7), 'tag{}'.format(i % 11)]
+            }})
+        
+        elif rng.random() < 0.1:
+            existing.discard(_id)
+            messages.append({'msg': 'removed', 'collection': collection, 'id': _id})
+        
+        else:
+            messages.append({'msg': 'changed', 'collection': collection, 'id': _id, 'fields': {'value': i}})
+    
+    return messages
+
+def load_script(path):
+    '''Reads a stream from a file with one JSON message per line.'''
+    
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+class FakeDDPServer:
+    def __init__(self, methods = None, publications = None, host = '127.0.0.1', port = 0, latency = 0, ping_every = None, streams = None, rate = None,
+                 upload_latency = 0.005, keep_uploads = False, stall_reads = None):
+        self.methods = methods or {}
+        self.latency = latency
+        self.ping_every = ping_every
+        self.publications = publications or {}
+        self.streams = streams or {}
+        self.rate = rate
+        self.upload_latency = upload_latency
+        self.keep_uploads = keep_uploads
+        self.stall_reads = stall_reads
+        self.host = host
+        self.port = port
+        
+        self.files = {}
+        self.uploads = {}
+        self.bytes_received = 0
+        
+        self._runner = None
+        self._sessions = itertools.count(1)
+        self.connections = set()
+    
+    @property
+    def url(self):
+        return 'ws://{}:{}/websocket'.format(self.host, self.port)
+    
+    async def start(self):
+        app = web.Application(client_max_size = 1024 ** 3)
+        app.router.add_get('/websocket', self.__handler__)
+        app.router.add_post('/cdn/storage/upload', self.__upload__)
+        
+        self._runner = web.AppRunner(app, access_log = None)
+        await self._runner.setup()
+        
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+    
+    async def stop(self):
+        for websocket in list(self.connections):
+            await websocket.close()
+        
+        await self._runner.cleanup()
+    
+    async def drop_connections(self):
+        '''Closes every client connection, as if the network had failed.'''
+        for websocket in list(self.connections):
+            websocket.transport.abort()
+    
+    async def __handler__(self, request):
+        websocket = web.WebSocketResponse(max_msg_size = 0)
+        await websocket.prepare(request)
+        
+        self.connections.add(websocket)
+        websocket.transport = request.transport
+        
+        # Maps each (collection, id) sent over this connection to the ids of the subscriptions publishing it, and each subscription to its items.
+        websocket.published = {}
+        websocket.subs = {}
+        websocket.streams = {}
+        websocket.pongs = 0
+        
+        try:
+            async for message in websocket:
+                if message.type != aiohttp.WSMsgType.TEXT: continue
+                
+                msg = json.loads(message.data)
+                _type = msg.get('msg')
+                
+                if _type == 'connect':
+                    await self.__send__(websocket, {'msg': 'connected', 'session': str(next(self._sessions))})
+                
+                elif _type == 'ping':
+                    await self.__send__(websocket, {'msg': 'pong', 'id': msg.get('id')})
+                
+                elif _type == 'pong':
+                    websocket.pongs += 1
+                
+                elif _type == 'method':
+                    await self.__method__(websocket, msg)
+                
+                elif _type == 'sub':
+                    await self.__sub__(websocket, msg)
+                
+                elif _type == 'unsub':
+                    await self.__unsub__(websocket, msg)
+        
+        except ConnectionResetError:
+            pass
+        
+        finally:
+            self.connections.discard(websocket)
+            for task in websocket.streams.values(): task.cancel()
+        
+        return websocket
+    
+    async def __send__(self, websocket, msg):
+        await websocket.send_str(json.dumps(msg))
+    
+    async def __sub__(self, websocket, msg):
+        if self.stall_reads:
+            websocket.transport.pause_reading()
+            asyncio.get_event_loop().call_later(self.stall_reads, websocket.transport.resume_reading)
+        
+        fn = self.publications.get(msg['name'])
+        stream = self.streams.get(msg['name'])
+        
+        if not fn and not stream:
+            await self.__send__(websocket, {'msg': 'nosub', 'id': msg['id'], 'error': {'error': 404, 'message': 'Subscription not found'}})
+            return
+        
+        items = websocket.subs[msg['id']] = []
+        
+        for collection, _id, fields in fn(*msg.get('params', [])) if fn else ():
+            items.append((collection, _id))
+            
+            owners = websocket.published.setdefault((collection, _id), set())
+            owners.add(msg['id'])
+            if len(owners) == 1:
+                await self.__send__(websocket, {'msg': 'added', 'collection': collection, 'id': _id, 'fields': fields})
+            
+            if self.ping_every and len(items) % self.ping_every == 0:
+                await self.__send__(websocket, {'msg': 'ping', 'id': str(len(items))})
+        
+        await self.__send__(websocket, {'msg': 'ready', 'subs': [msg['id']]})
+        
+        if stream:
+            websocket.streams[msg['id']] = asyncio.ensure_future(self.__stream__(websocket, stream(*msg.get('params', []))))
+    
+    async def __stream__(self, websocket, messages):
+        '''Sends the messages of a stream, spaced out to the server's rate.'''
+        
+        loop = asyncio.get_event_loop()
+        started = loop.time()
+        
+        try:
+            for i, msg in enumerate(messages):
+                if self.rate:
+                    delay = started + i / self.rate - loop.time()
+                    if delay > 0: await asyncio.sleep(delay)
+                
+                await self.__send__(websocket, msg)
+        
+        except ConnectionResetError:
+            pass
+    
+    async def __unsub__(self, websocket, msg):
+        stream = websocket.streams.pop(msg['id'], None)
+        if stream: stream.cancel()
+        
+        for item in websocket.subs.pop(msg['id'], ()):
+            owners = websocket.published[item]
+            owners.discard(msg['id'])
+            
+            if not owners:
+                del websocket.published[item]
+                await self.__send__(websocket, {'msg': 'removed', 'collection': item[0], 'id': item[1]})
+        
+        await self.__send__(websocket, {'msg': 'nosub', 'id': msg['id']})
+    
+    async def __method__(self, websocket, msg):
+        fn = self.methods.get(msg['method'])
+        if self.latency: await asyncio.sleep(self.latency)
+        
+        if fn:
+            reply = {'msg': 'result', 'id': msg['id'], 'result': fn(*msg.get('params', []))}
+        elif msg['method'].startswith('_FilesCollectionStart_'):
+            reply = {'msg': 'result', 'id': msg['id'], 'result': {'uploadRoute': '/cdn/storage/upload'}}
+        else:
+            reply = {'msg': 'result', 'id': msg['id'], 'error': {'error': 404, 'message': 'Method not found'}}
+        
+        await self.__send__(websocket, reply)
+        await self.__send__(websocket, {'msg': 'updated', 'methods': [msg['id']]})
+    
+    async def __upload__(self, request):
+        body = await request.read()
+        self.bytes_received += len(body)
+        
+        # Simulates the round trip and the server's processing time for each chunk.
+        await asyncio.sleep(self.upload_latency)
+        
+        file_id = request.headers['x-fileId']
+        file = self.files.setdefault(file_id, {})
+        
+        if request.headers['x-eof'] == '1':
+            file['eof'] = True
+            if 'x-fileSize' in request.headers:
+                file['size'] = int(request.headers['x-fileSize'])
+                file['length'] = int(request.headers['x-fileLength'])
+        else:
+            chunk_id = int(request.headers['x-chunkId'])
+            file[chunk_id] = len(body)
+            if self.keep_uploads: self.uploads.setdefault(file_id, {})[chunk_id] = base64.b64decode(body)
+        
+        return web.Response(status = 204)
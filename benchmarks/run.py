@@ -0,0 +1,129 @@
+'''Runs a suite of benchmarks against the local fake DDP server and prints the results as JSON, so that they can be stored and compared between versions.
+
+The suite measures:
+    initial_sync: documents per second received in a subscription's initial sync, in the default and compact Collection storage modes.
+    stream: messages per second of a randomized stream of added, changed and removed messages sent after a subscription is ready.
+    calls: method call throughput and latency percentiles, see bench_calls.
+    memory: bytes of memory used per stored document, in both storage modes, see bench_collection_storage.
+    upload: MeteorFilesUploader throughput in MiB per second, see bench_upload.
+
+The scale argument multiplies the amount of work done by each benchmark, e.g. 0.1 for a quick run.
+
+Run from the repository root:
+    python -m benchmarks.run [scale] > results.json
+'''
+
+import asyncio
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import websockets
+
+from ddp_asyncio import DDPClient
+
+from . import bench_calls, bench_collection_storage, bench_upload
+from .bench_ingest import document
+from .fake_server import FakeDDPServer, random_stream
+
+async def initial_sync(count):
+    server = FakeDDPServer(publications = {'items': lambda count: map(document, range(count))})
+    await server.start()
+    
+    results = {}
+    
+    for compact in (False, True):
+        client = DDPClient(server.url, compact_collections = compact)
+        await client.connect()
+        
+        started = time.perf_counter()
+        sub = await client.subscribe('items', count)
+        await sub.wait()
+        elapsed = time.perf_counter() - started
+        
+        await client.disconnect()
+        results['compact' if compact else 'default'] = {'documents': count, 'documents_per_second': count / elapsed}
+    
+    await server.stop()
+    return results
+
+async def stream(count):
+    messages = random_stream('items', count, items = max(count // 10, 1))
+    
+    server = FakeDDPServer(streams = {'items': lambda: messages})
+    await server.start()
+    
+    client = DDPClient(server.url)
+    await client.connect()
+    queue = client.get_collection('items').get_queue()
+    
+    started = time.perf_counter()
+    await client.subscribe('items')
+    for i in range(count): await queue.get()
+    elapsed = time.perf_counter() - started
+    
+    await client.disconnect()
+    await server.stop()
+    
+    return {'messages': count, 'messages_per_second': count / elapsed}
+
+def memory(count):
+    frames = bench_collection_storage.make_frames(count)
+    results = {}
+    
+    for compact in (False, True):
+        col, elapsed, used = bench_collection_storage.load(frames, compact, True)
+        del col
+        results['compact' if compact else 'default'] = {'documents': count, 'bytes_per_document': used / count}
+    
+    return results
+
+async def upload(size):
+    with tempfile.NamedTemporaryFile() as f:
+        f.write(os.urandom(size))
+        f.flush()
+        
+        results = await bench_upload.run(f.name, size, 0.005, ((4, 1048576),))
+    
+    concurrency, chunk_size, throughput = results[0]
+    return {'bytes': size, 'concurrency': concurrency, 'chunk_size': chunk_size, 'mib_per_second': throughput}
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    
+    return {
+        'time': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'websockets': websockets.__version__,
+        'cpus': os.cpu_count()
+    }
+
+def main():
+    scale = float(sys.argv[1]) if len(sys.argv) > 1 else 1
+    loop = asyncio.get_event_loop()
+    
+    results = {
+        'environment': environment(),
+        'scale': scale,
+        'initial_sync': loop.run_until_complete(initial_sync(int(100000 * scale))),
+        'stream': loop.run_until_complete(stream(int(100000 * scale))),
+        'calls': loop.run_until_complete(bench_calls.run(int(20000 * scale), 500)),
+        'memory': memory(int(100000 * scale)),
+        'upload': loop.run_until_complete(upload(int(64 * 1048576 * scale)))
+    }
+    
+    json.dump(results, sys.stdout, indent = 4)
+    print()
+
+if __name__ == '__main__':
+    main()
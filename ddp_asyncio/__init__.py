@@ -3,3 +3,4 @@ __version__ = '0.3'
 from .extras import *
 from .exceptions import *
 from .ddpclient import DDPClient
+from .pool import DDPClientPool
@@ -0,0 +1,52 @@
+import concurrent.futures
+import sqlite3
+
+class CollectionCache:
+    '''Keeps a copy of Collection items in an SQLite database, so that a restarted client starts with the items it had before.
+    
+    The path argument is the database's file name. Items are serialized with the client's codec.
+    
+    DDPClient loads the cache when connecting, and saves changed items periodically and when disconnecting, see DDPClient.
+    The database is only accessed from the cache's executor, which has a single thread, so saves are written in the order they were made.
+    '''
+    
+    def __init__(self, path):
+        self.path = path
+        
+        self.executor = concurrent.futures.ThreadPoolExecutor(1)
+        self._db = sqlite3.connect(path, check_same_thread = False)
+        
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS items (collection TEXT NOT NULL, id TEXT NOT NULL, fields TEXT NOT NULL, PRIMARY KEY (collection, id)) WITHOUT ROWID')
+    
+    def load(self, codec):
+        '''Returns a dictionary mapping each collection's name to a list of (_id, fields) tuples.'''
+        
+        collections = {}
+        
+        for collection, _id, fields in self._db.execute('SELECT collection, id, fields FROM items'):
+            collections.setdefault(collection, []).append((_id, codec.loads(fields)))
+        
+        return collections
+    
+    def save(self, updated, removed):
+        '''Stores updated items and deletes removed ones in a single transaction.
+        
+        updated is a list of (collection, _id, serialized fields) tuples and removed a list of (collection, _id) tuples.
+        '''
+        
+        with self._db:
+            self._db.executemany('INSERT OR REPLACE INTO items (collection, id, fields) VALUES (?, ?, ?)', updated)
+            self._db.executemany('DELETE FROM items WHERE collection = ? AND id = ?', removed)
+    
+    def clear(self):
+        '''Deletes every cached item.'''
+        self.executor.submit(self.__clear__).result()
+    
+    def __clear__(self):
+        with self._db:
+            self._db.execute('DELETE FROM items')
+    
+    def close(self):
+        self.executor.submit(self._db.close).result()
+        self.executor.shutdown()
@@ -0,0 +1,128 @@
+'''Codecs used to serialize and deserialize DDP messages.
+
+DDPClient accepts the name of one of the codecs below, or any object with dumps() and loads() methods:
+    'ejson': the ejson package, used by default.
+    'json': the standard library's json module, which uses its C accelerator when available.
+    'orjson': the orjson package, if it is installed.
+
+Every built-in codec decodes a frame to the same Python values: Meteor EJSON values are converted by from_ejson(), so $date becomes an aware datetime,
+$binary becomes bytes, $InfNaN becomes a float and $escape is unwrapped. The conversion only runs when a frame actually contains a $-prefixed key,
+all other frames are decoded directly by the underlying JSON library. Switching codecs therefore doesn't change what Collections store.
+
+When encoding, every built-in codec writes datetimes and bytes as $date and $binary, so values decoded from the server or loaded from the cache are encoded back the same way.
+The ejson codec also encodes other types with the serializers registered with the ejson package.
+'''
+
+import base64
+import datetime
+import json
+import math
+
+import ejson
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def from_ejson(value):
+    '''Converts Meteor EJSON values contained in decoded JSON to their Python equivalents.'''
+    
+    if isinstance(value, dict):
+        if len(value) == 1:
+            key, inner = next(iter(value.items()))
+            
+            if key == '$date':
+                return datetime.datetime.fromtimestamp(inner / 1000, datetime.timezone.utc)
+            elif key == '$binary':
+                return base64.b64decode(inner)
+            elif key == '$InfNaN':
+                return math.copysign(math.inf, inner) if inner else math.nan
+            elif key == '$escape':
+                return {k: from_ejson(v) for k, v in inner.items()}
+        
+        # Custom {'$type': ..., '$value': ...} values have no Python equivalent and are left as they are.
+        return {k: from_ejson(v) for k, v in value.items()}
+    
+    elif isinstance(value, list):
+        return [from_ejson(v) for v in value]
+    
+    return value
+
+def to_ejson(value):
+    '''Converts Python values which JSON cannot represent to Meteor EJSON, for use as a JSON encoder's default function.'''
+    
+    if isinstance(value, datetime.datetime):
+        return {'$date': int(value.timestamp() * 1000)}
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        return {'$binary': base64.b64encode(value).decode('ascii')}
+    
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(value).__name__))
+
+class EJSONCodec:
+    '''Serializes messages using the ejson package, converting Meteor EJSON values in frames which contain them like the other codecs.'''
+    
+    def __init__(self):
+        self._encoder = json.JSONEncoder(separators = (',', ':'), sort_keys = True, default = self.__default__)
+    
+    def __default__(self, value):
+        if isinstance(value, (datetime.datetime, bytes, bytearray, memoryview)):
+            return to_ejson(value)
+        
+        # Anything else goes through the ejson package's serializers, which raise TypeError for unknown types.
+        return json.loads(ejson.dumps(value))
+    
+    def dumps(self, msg):
+        return self._encoder.encode(msg)
+    
+    def loads(self, data):
+        msg = ejson.loads(data)
+        return from_ejson(msg) if '"$' in data else msg
+
+class JSONCodec:
+    '''Serializes messages using the standard library's json module, only converting EJSON values in frames which contain them.'''
+    
+    def __init__(self):
+        self._encoder = json.JSONEncoder(separators = (',', ':'), default = to_ejson)
+        self._decode = json.JSONDecoder().decode
+    
+    def dumps(self, msg):
+        return self._encoder.encode(msg)
+    
+    def loads(self, data):
+        msg = self._decode(data)
+        return from_ejson(msg) if '"$' in data else msg
+
+class OrjsonCodec:
+    '''Serializes messages using orjson, only converting EJSON values in frames which contain them.'''
+    
+    def __init__(self):
+        if not orjson:
+            raise ImportError('The orjson codec requires the orjson package to be installed.')
+    
+    def dumps(self, msg):
+        return orjson.dumps(msg, default = to_ejson, option = orjson.OPT_PASSTHROUGH_DATETIME).decode('utf-8')
+    
+    def loads(self, data):
+        msg = orjson.loads(data)
+        return from_ejson(msg) if '"$' in data else msg
+
+codecs = {
+    'ejson': EJSONCodec,
+    'json': JSONCodec,
+    'orjson': OrjsonCodec
+}
+
+def get_codec(codec):
+    '''Returns a codec instance, codec may be the name of a built-in codec or an existing codec object.'''
+    
+    if codec is None:
+        codec = 'ejson'
+    
+    if isinstance(codec, str):
+        if codec not in codecs:
+            raise ValueError('Unknown codec "{}", expected one of: {}'.format(codec, ', '.join(sorted(codecs))))
+        
+        return codecs[codec]()
+    
+    return codec
@@ -1,9 +1,12 @@
-import collections
-import asyncio
-import random
+import collections.abc
+import itertools
 import weakref
 
-from .dotable import Dotable
+from .dotable import Dotable, Document, DotView
+from .index import HashIndex, SortedIndex, matches, validate
+from .collectionqueue import CollectionQueue
+from .view import CollectionView, GroupBy
+from .ordered import OrderIndex
 
 class CollectionEvent(Dotable):
     '''Represents a change to a Collection.
@@ -15,34 +18,86 @@ class CollectionEvent(Dotable):
         _id: id of added item
         fields: contents of added item
     The fields property can be accessed like a dictionary or using dot-notation attribute access.
+    In ordered Collections, additions also have these properties:
+        before_id: id of the item the added item was placed before, or None if it was placed at the end
+        index: position of the added item
     
     Changes have the following properties:
         type: 'changed'
         _id: id of changed item
         fields: contents of changed item
         cleared: list of keys removed from the item
+    If the Collection records diffs, changes also have these properties, which only contain the keys set or cleared by the change:
+        before: the item's previous values. Keys the item did not have are left out.
+        after: the item's new values. Cleared keys are left out.
     
     Removals have the following properties:
         type: 'removed'
         _id: id of removed item
+    
+    Moves only happen in ordered Collections, and have the following properties:
+        type: 'moved'
+        _id: id of moved item
+        before_id: id of the item the moved item was placed before, or None if it was moved to the end
+        index: new position of the moved item
+    
+    Batches report many additions or removals at once, see DDPClient.subscribe(). They have the following properties:
+        type: 'batch'
+        _id: None
+        added: list of ids of added items
+        removed: list of ids of removed items
     '''
     pass
 
-# Note: Collection does not currently support ordered collections, since Meteor doesn't use them.
-
-class Collection(collections.Mapping):
+class Collection(collections.abc.Mapping):
     '''Stores data published from a connected server.
 
     Collections are read-only and function identically to a dictionary, with each item's _id as the key.
 
     A Collection item's attributes can be accessed like a dictionarie or with dot-notation attribute access, i.e. "item.attr"
+    
+    Each message is parsed only once, and nested values are shared between stored items and CollectionEvents instead of being copied, so they must not be modified in place.
+    If compact is True, nested dicts and lists are stored as they were decoded, and wrapped in read-only views when accessed as attributes, while item access returns the plain values.
+    
+    If diffs is True, changed CollectionEvents also carry the previous and new values of the keys they touch, see CollectionEvent.
+    
+    A Collection becomes ordered once the server publishes an item to it with an addedBefore message, and then keeps its items in the order given by the server.
+    Iterating over an ordered Collection yields the _ids in that order, index() returns an item's position and at() the item at a position or the items in a slice.
+    Each of these takes O(log n) time, plus the length of a slice, see ddp_asyncio.ordered. Items which the server moves are reported with moved CollectionEvents.
     '''
 
-    def __init__(self, name):
+    def __init__(self, name, compact = False, diffs = False):
         self._name = name
         self._data = {}
+        self._compact = compact
+        self._diffs = diffs
+        self._indexes = {}
 
-        self._queues = set()
+        self._queues = weakref.WeakSet()
+        self._id_queues = {}
+        self._views = weakref.WeakSet()
+        self._blocked = set()
+        
+        # The order of the items if the Collection is ordered, otherwise None.
+        self._order = None
+        
+        self._stale = None
+        self._metrics = None
+        
+        # The server's version of each item written by a method stub whose writes have not been confirmed yet, see DDPClient.stub().
+        # Maps each _id to a list of the server's fields (None if the server has no such item), the item's owners and the ids of the methods which wrote it.
+        self._server_docs = {}
+        
+        # The subscriptions which were waiting to become ready when each item was added, shared between items, and the number of items sharing each set.
+        self._owners = {}
+        self._owner_sets = {}
+        
+        # Items of bulk subscriptions which have not become ready yet, and removals deferred until an unsubscription completes.
+        self._buffered = {}
+        self._deferred_removals = {}
+        
+        # The ids of items changed since they were last saved to the client's cache, or None if the client has no cache.
+        self._dirty = None
 
     def __getitem__(self, key):
         return self._data[key]
@@ -51,7 +106,7 @@ class Collection(collections.Mapping):
         return len(self._data)
     
     def __iter__(self):
-        return iter(self._data)
+        return iter(self._data if self._order is None else self._order)
     
     def __bool__(self):
         return True
@@ -59,48 +114,511 @@ class Collection(collections.Mapping):
     def __repr__(self):
         return '<collection {}>'.format(self._name)
 
-    def get_queue(self):
+    @property
+    def ordered(self):
+        '''True if the server publishes this Collection's items in order.'''
+        return self._order is not None
+    
+    def index(self, _id):
+        '''Returns the position of an item in an ordered Collection. Raises KeyError if there is no such item, and TypeError if the Collection is not ordered.'''
+        return self.__require_order__().index(_id)
+    
+    def at(self, position):
+        '''Returns the item at a position in an ordered Collection, or a list of items if position is a slice. Raises TypeError if the Collection is not ordered.'''
+        
+        ids = self.__require_order__()[position]
+        if isinstance(position, slice): return [self._data[_id] for _id in ids]
+        return self._data[ids]
+    
+    def __require_order__(self):
+        if self._order is None: raise TypeError('Collection {} is not ordered.'.format(self._name))
+        return self._order
+    
+    def get_queue(self, maxsize = 0, overflow = 'block', ids = None, types = None, fields = None, query = None):
         '''Creates and returns a new asyncio.Queue to monitor changes to a Collection.
         When the collection changes, a CollectionEvent object containing a description of the change is pushed to the queue.
+        
+        The queue can be bounded with maxsize, and the events it receives can be filtered by _id, event type, changed fields or a query.
+        See CollectionQueue for a description of the arguments.
         '''
         
-        q = asyncio.Queue()
-        self._queues.add(weakref.ref(q))
+        q = CollectionQueue(maxsize, overflow, ids, types, fields, query)
+        self.__add_queue__(q)
         return q
+    
+    def __add_queue__(self, q):
+        if q.ids is None:
+            self._queues.add(q)
+        else:
+            # Queues interested in specific items are only looked up for events concerning those items.
+            ref = weakref.ref(q)
+            for _id in q.ids:
+                self._id_queues.setdefault(_id, set()).add(ref)
 
-    def __put__(self, data):
-        for ref in self._queues:
+    def __all_queues__(self):
+        '''Returns every queue receiving events from this Collection or its views.'''
+        
+        queues = set(self._queues)
+        for refs in self._id_queues.values():
+            queues.update(q for q in (ref() for ref in refs) if q is not None)
+        for view in self._views:
+            queues.update(view._queues)
+        
+        return queues
+    
+    def view(self, filter = None, sort = None, limit = None):
+        '''Creates and returns a CollectionView, which keeps the items passing a filter in sorted order as the Collection changes.
+        
+        The filter may be a query (see ddp_asyncio.index) or a function which is called with an item and returns True if it should be included.
+        An invalid query raises ValueError. If a filter function raises an exception while the Collection changes, the view stops being updated, see View.error.
+        The sort argument may be a field name, a list of (field, direction) tuples or a dictionary mapping fields to directions, where 1 sorts ascending and -1 descending.
+        Items which sort equally are ordered by _id. If limit is set, only that many items from the start of the sorted order are included.
+        '''
+        return CollectionView(self, filter, sort, limit)
+    
+    def group_by(self, key, filter = None):
+        '''Groups the items passing a filter by a field, or by the result of a function called with each item.
+        Returns a GroupBy, whose count() and sum(field) methods create Aggregates mapping each group to a value which is kept up to date as the Collection changes.
+        '''
+        return GroupBy(self, key, filter)
+    
+    def create_index(self, field, sorted = False):
+        '''Creates a secondary index on a field, which may use dot-notation to refer to a nested field.
+        Indexes are used by find() and find_one(), and are kept up to date as the Collection changes.
+        
+        A hash index speeds up equality and $in queries. If sorted is True a sorted index is created instead, which also speeds up range queries.
+        '''
+        
+        index = (SortedIndex if sorted else HashIndex)(field)
+        for _id, doc in self._data.items():
+            index.add(_id, doc)
+        
+        self._indexes[field] = index
+    
+    def drop_index(self, field):
+        '''Removes the index on a field.'''
+        del self._indexes[field]
+    
+    def find(self, query = None):
+        '''Returns a list of the items which match a query, see ddp_asyncio.index for the query syntax.
+        If any of the queried fields are indexed, the index with the fewest candidates is used instead of scanning every item.
+        '''
+        
+        if not query:
+            return list(self._data.values())
+        
+        validate(query)
+        
+        ids = None
+        for field, condition in query.items():
+            index = self._indexes.get(field)
+            if not index: continue
+            
+            candidates = index.lookup(condition)
+            if candidates is not None and (ids is None or len(candidates) < len(ids)):
+                ids = candidates
+        
+        docs = self._data.values() if ids is None else (self._data[_id] for _id in ids if _id in self._data)
+        return [doc for doc in docs if matches(doc, query)]
+    
+    def find_one(self, query = None):
+        '''Returns an item which matches a query, or None if no items match.'''
+        
+        docs = self.find(query)
+        return docs[0] if docs else None
+    
+    def __put__(self, data, doc = None):
+        if self._metrics: self._metrics.__collection_event__(self._name, data)
+        
+        if self._dirty is not None:
+            if data['type'] == 'batch':
+                self._dirty.update(data['added'])
+                self._dirty.update(data['removed'])
+            else:
+                self._dirty.add(data['_id'])
+        
+        for view in list(self._views):
+            try:
+                view.__update__(data, doc)
+            except Exception as e:
+                view.__fail__(e)
+        
+        for q in self._queues:
+            q.__push__(data, doc)
+            if q.__blocking__(): self._blocked.add(weakref.ref(q))
+        
+        if data['type'] == 'batch':
+            return self.__put_batch__(data, doc)
+        
+        refs = self._id_queues.get(data['_id'])
+        if refs:
+            for ref in list(refs):
+                q = ref()
+                
+                if q is None:
+                    refs.discard(ref)
+                else:
+                    q.__push__(data, doc)
+                    if q.__blocking__(): self._blocked.add(ref)
+            
+            if not refs: del self._id_queues[data['_id']]
+    
+    def __put_batch__(self, data, docs):
+        '''Pushes a batch event to each queue interested in any of the batch's items.'''
+        
+        refs = set()
+        for _id in data['added'] + data['removed']:
+            refs.update(self._id_queues.get(_id, ()))
+        
+        for ref in refs:
             q = ref()
-            if q: q.put_nowait(data)
+            if q is None: continue
+            
+            q.__push__(data, docs)
+            if q.__blocking__(): self._blocked.add(ref)
+    
+    async def __drain__(self):
+        '''Waits until no queue with a blocking overflow policy is over its limit.'''
+        
+        while self._blocked:
+            ref = self._blocked.pop()
+            q = ref()
+            
+            while q is not None and q.__blocking__():
+                space = q._space
+                space.clear()
+                
+                # Only the queue's reader or the queue being garbage collected can release the client, so no reference is held while waiting.
+                q = None
+                await space.wait()
+                q = ref()
+    
+    def __event__(self, data):
+        # Values are already parsed, or shared with the stored item in compact mode, and are not copied again.
+        return CollectionEvent.shallow(data)
+    
+    def __reindex__(self, _id, doc, fields = None, add = True):
+        '''Adds an item to or removes it from the indexes, if fields is set only the indexes on those fields are updated.'''
+        
+        for field, index in self._indexes.items():
+            if fields is None or field.split('.', 1)[0] in fields:
+                if add:
+                    index.add(_id, doc)
+                else:
+                    index.remove(_id, doc)
 
-    def __added__(self, _id, fields):
-        self._data[_id] = Dotable.parse(fields)
-        self._data[_id]['_id'] = _id
+    def __reset__(self):
+        '''Discards all items, when connecting to a new session.'''
+        
+        self._data = {}
+        self._owners = {}
+        self._owner_sets = {}
+        self._buffered = {}
+        self._deferred_removals = {}
+        self._server_docs = {}
+        self._order = None
+        
+        for field, index in self._indexes.items():
+            self._indexes[field] = type(index)(field)
+        
+        for view in list(self._views):
+            try:
+                view.__rebuild__()
+            except Exception as e:
+                view.__fail__(e)
+    
+    def __begin_resync__(self):
+        '''Starts reconciling this Collection with the data the server sends after reconnecting.
+        Items which are sent again are compared with the stored item, and only reported as changed if they differ.
+        '''
+        
+        # Everything held back or deferred belongs to the previous session, the server sends the current state again.
+        self._buffered = {}
+        self._deferred_removals = {}
+        
+        # Items written by method stubs are not removed when the server does not send them again, their server versions are replaced by what it sends instead.
+        for shadow in self._server_docs.values():
+            shadow[0] = shadow[1] = None
+        
+        self._stale = set(self._data).difference(self._server_docs)
+    
+    def __end_resync__(self):
+        '''Finishes reconciling, any item which the server did not send again is removed.'''
+        
+        stale, self._stale = self._stale, None
+        for _id in stale or ():
+            if _id in self._data: self.__removed__(_id)
+    
+    def __reconcile__(self, _id, fields):
+        '''Applies an item resent by the server as a change containing only the fields which differ from the stored item.'''
         
-        self.__put__(CollectionEvent({
+        self._stale.discard(_id)
+        self.__replace__(_id, fields)
+    
+    def __replace__(self, _id, fields):
+        '''Replaces the fields of a stored item, reporting a change containing only the fields which differ.'''
+        
+        doc = self._data[_id]
+        
+        changed = {key: value for key, value in fields.items() if key not in doc or doc[key] != value}
+        cleared = [key for key in doc if key != '_id' and key not in fields]
+        
+        if changed or cleared: self.__changed__(_id, changed, cleared)
+    
+    def __stub_write__(self, _id, method_id):
+        '''Keeps the server's version of an item which a method stub is about to write, until the server has confirmed the method's writes.'''
+        
+        shadow = self._server_docs.get(_id)
+        
+        if shadow is None:
+            doc = self._data.get(_id)
+            fields = None if doc is None else {key: value for key, value in doc.items() if key != '_id'}
+            shadow = self._server_docs[_id] = [fields, self._owners.get(_id), set()]
+        
+        shadow[2].add(method_id)
+    
+    def __shadow__(self, _type, _id, fields = None, cleared = (), owners = None):
+        '''Applies a message from the server to the server's version of an item written by a method stub, instead of to the item itself.'''
+        
+        shadow = self._server_docs[_id]
+        
+        if _type == 'added':
+            shadow[0], shadow[1] = dict(fields), owners
+            if self._stale is not None: self._stale.discard(_id)
+        
+        elif _type == 'changed':
+            if shadow[0] is None: return
+            
+            shadow[0].update(fields)
+            for key in cleared:
+                shadow[0].pop(key, None)
+        
+        else:
+            shadow[0] = shadow[1] = None
+    
+    def __unstub__(self, method_id):
+        '''Resets each item written by a method, which no other unconfirmed method has written, to the server's version.
+        Only the differences between the optimistic and the server's version are reported.
+        '''
+        
+        for _id, (fields, owners, methods) in list(self._server_docs.items()):
+            if method_id not in methods: continue
+            
+            methods.discard(method_id)
+            if methods: continue
+            
+            del self._server_docs[_id]
+            
+            if fields is None:
+                if _id in self._data: self.__removed__(_id)
+            
+            elif _id not in self._data:
+                self.__added__(_id, fields, owners)
+            
+            else:
+                self.__replace__(_id, fields)
+                self.__set_owners__(_id, owners)
+
+    def __buffer__(self, _id, fields, owners):
+        '''Holds back an item sent for a bulk subscription until one of its owners becomes ready.'''
+        self._buffered[_id] = (fields, owners)
+    
+    def __flush__(self, subs):
+        '''Stores the buffered items owned by any of the given subscriptions, and reports them in a single batch event.'''
+        
+        added = [_id for _id, (fields, owners) in self._buffered.items() if not owners.isdisjoint(subs)]
+        if not added: return
+        
+        docs = []
+        for _id in added:
+            fields, owners = self._buffered.pop(_id)
+            docs.append(self.__store__(_id, fields, owners))
+        
+        self.__batch__(added, [], docs)
+    
+    def __flush_removals__(self, sub):
+        '''Removes the items whose removal was deferred while a subscription was being stopped, and reports them in a single batch event.'''
+        
+        removed = [_id for _id, owners in self._deferred_removals.items() if sub in owners]
+        if not removed: return
+        
+        docs = []
+        for _id in removed:
+            del self._deferred_removals[_id]
+            docs.append(self.__discard__(_id))
+        
+        self.__batch__([], removed, docs)
+    
+    def __load__(self, items):
+        '''Stores (_id, fields) tuples loaded from the client's cache, and reports them in a single batch event.'''
+        
+        docs = [self.__store__(_id, fields, None) for _id, fields in items]
+        self.__batch__([_id for _id, fields in items], [], docs)
+    
+    def __batch__(self, added, removed, docs):
+        self.__put__(self.__event__({
+            'type': 'batch',
+            '_id': None,
+            'added': added,
+            'removed': removed
+        }), docs)
+    
+    def __store__(self, _id, fields, owners, before = None):
+        '''Stores an item sent by the server and returns it. In an ordered Collection, a new item is placed before the item before, or at the end.'''
+        
+        doc = Document(fields) if self._compact else Dotable.parse(fields)
+        doc['_id'] = _id
+        
+        if self._indexes:
+            if _id in self._data: self.__reindex__(_id, self._data[_id], add = False)
+            self.__reindex__(_id, doc)
+        
+        self._data[_id] = doc
+        if self._order is not None and _id not in self._order: self._order.insert(_id, before)
+        
+        self.__set_owners__(_id, owners)
+        return doc
+    
+    def __set_owners__(self, _id, owners):
+        '''Records the subscriptions an item is attributed to, counting the items which share each set of subscriptions.'''
+        
+        previous = self._owners.pop(_id, None)
+        if previous:
+            count = self._owner_sets[previous] - 1
+            if count:
+                self._owner_sets[previous] = count
+            else:
+                del self._owner_sets[previous]
+        
+        if owners:
+            self._owners[_id] = owners
+            self._owner_sets[owners] = self._owner_sets.get(owners, 0) + 1
+    
+    def __owned__(self, sub):
+        '''Returns the number of items attributed to a subscription alone.'''
+        return self._owner_sets.get(frozenset((sub,)), 0)
+    
+    def __discard__(self, _id):
+        '''Removes an item and returns it.'''
+        
+        doc = self._data.pop(_id)
+        self.__set_owners__(_id, None)
+        if self._order is not None: self._order.remove(_id)
+        
+        if self._indexes:
+            self.__reindex__(_id, doc, add = False)
+        
+        return doc
+    
+    def __added_before__(self, _id, fields, before, owners = None):
+        '''Adds an item sent with an addedBefore message, making the Collection ordered if it was not already.'''
+        
+        if self._order is None:
+            self._order = OrderIndex(self._data)
+        
+        self.__added__(_id, fields, owners, before)
+    
+    def __added__(self, _id, fields, owners = None, before = None):
+        if self._deferred_removals.pop(_id, None):
+            # The item was published again before its removal was applied, so the removal is applied first to keep events in order.
+            self.__removed__(_id)
+        
+        if self._stale is not None and _id in self._data:
+            self.__reconcile__(_id, fields)
+            
+            # Items are resent in order, so an item which is now somewhere else is moved there.
+            if self._order is not None and self._order.next(_id) != before: self.__moved_before__(_id, before)
+            return
+        
+        doc = self.__store__(_id, fields, owners, before)
+        event_fields = DotView(fields) if self._compact else Dotable.shallow({key: doc[key] for key in fields})
+        
+        event = {
             'type': 'added',
             '_id': _id,
-            'fields': Dotable.parse(fields)
-        }))
+            'fields': event_fields
+        }
+        
+        if self._order is not None:
+            event['before_id'] = before if before in self._order else None
+            event['index'] = self._order.index(_id)
+        
+        self.__put__(self.__event__(event), doc)
+    
+    def __moved_before__(self, _id, before):
+        '''Moves an item of an ordered Collection before another item, or to the end if before is None.'''
+        
+        if self._order is None or _id not in self._order: return
+        
+        before = before if before in self._order else None
+        self._order.move(_id, before)
+        
+        self.__put__(self.__event__({
+            'type': 'moved',
+            '_id': _id,
+            'before_id': before,
+            'index': self._order.index(_id)
+        }), self._data[_id])
     
     def __changed__(self, _id, fields, cleared):
-        if fields:
-            self._data[_id].update(fields)
-        elif cleared:
+        if _id in self._buffered:
+            buffered = self._buffered[_id][0]
             for key in cleared:
-                del self._data[_id][key]
+                buffered.pop(key, None)
+            buffered.update(fields)
+            return
+        
+        doc = self._data[_id]
+        
+        if self._indexes:
+            touched = set(fields).union(cleared)
+            self.__reindex__(_id, doc, touched, add = False)
         
-        self.__put__(CollectionEvent({
+        if self._diffs:
+            # Changes replace values rather than modifying them, so the previous values can be kept without copying them.
+            before = {key: doc[key] for key in itertools.chain(fields, cleared) if key in doc}
+        
+        if self._compact:
+            event_fields = DotView(fields)
+        else:
+            fields = Dotable.parse(fields)
+            event_fields = fields
+        
+        doc.update(fields)
+        for key in cleared:
+            doc.pop(key, None)
+        
+        if self._indexes:
+            self.__reindex__(_id, doc, touched)
+        
+        event = {
             'type': 'changed',
             '_id': _id,
-            'fields': Dotable.parse(fields),
+            'fields': event_fields,
             'cleared': cleared
-        }))
+        }
+        
+        if self._diffs:
+            after = {key: doc[key] for key in itertools.chain(fields, cleared) if key in doc}
+            event['before'] = DotView(before) if self._compact else Dotable.shallow(before)
+            event['after'] = DotView(after) if self._compact else Dotable.shallow(after)
+        
+        self.__put__(self.__event__(event), doc)
     
-    def __removed__(self, _id):
-        del self._data[_id]
+    def __removed__(self, _id, stopping = None):
+        if self._buffered.pop(_id, None):
+            return
+        
+        if stopping:
+            owners = self._owners.get(_id)
+            if owners and not owners.isdisjoint(stopping):
+                # Removed when the subscriptions in stopping are gone, unless it is published again before that.
+                self._deferred_removals[_id] = owners
+                return
+        
+        doc = self.__discard__(_id)
         
-        self.__put__(CollectionEvent({
+        self.__put__(self.__event__({
             'type': 'removed',
             '_id': _id
-        }))
+        }), doc)
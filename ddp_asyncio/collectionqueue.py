@@ -0,0 +1,157 @@
+import asyncio
+import weakref
+
+from .dotable import Dotable, DotView
+from .index import matches, validate
+
+overflow_policies = ('block', 'drop_oldest', 'coalesce')
+
+def _raw(fields):
+    return fields._dict if isinstance(fields, DotView) else fields
+
+class CollectionQueue(asyncio.Queue):
+    '''An asyncio.Queue which receives CollectionEvents from a Collection. Created by Collection.get_queue().
+    
+    If maxsize is set, the overflow policy decides what happens when more than maxsize events are waiting:
+        'block': the client stops reading from the server until the queue's reader catches up.
+        'drop_oldest': the oldest event is discarded. The dropped property counts discarded events.
+        'coalesce': a changed event is merged into a changed event for the same _id which is still waiting in the queue.
+            Other events block the client like 'block'.
+    
+    The filter arguments restrict which events are delivered:
+        ids: only deliver events for items whose _id is in this set.
+        types: only deliver events of these types, i.e. ('added', 'removed'). Include 'batch' to be told about items added or removed in bulk.
+        fields: only deliver changed events which set or clear one of these fields.
+        query: only deliver events for items matching this query, see ddp_asyncio.index. Removals are checked against the item before it was removed.
+    Batch events are delivered whole if any of their items pass the ids and query filters.
+    
+    The maxsize property and full() reflect the limit, but events are never refused: the overflow policy decides what happens once the queue is full.
+    '''
+    
+    def __init__(self, maxsize = 0, overflow = 'block', ids = None, types = None, fields = None, query = None):
+        if overflow not in overflow_policies:
+            raise ValueError('Unknown overflow policy "{}", expected one of: {}'.format(overflow, ', '.join(overflow_policies)))
+        
+        if query is not None: validate(query)
+        
+        # The underlying queue is unbounded, since events can never be refused. The limit is enforced by the overflow policy instead.
+        super().__init__()
+        
+        self._limit = maxsize
+        self._pushing = False
+        self.overflow = overflow
+        self.dropped = 0
+        
+        self.ids = frozenset(ids) if ids is not None else None
+        self.types = frozenset(types) if types is not None else None
+        self.fields = frozenset(fields) if fields is not None else None
+        self.query = query
+        
+        self._pending_changes = {}
+        
+        # Set whenever the queue drops below its limit. Also set if the queue is garbage collected, so a blocked client is released.
+        self._space = asyncio.Event()
+        weakref.finalize(self, self._space.set)
+    
+    def __accepts__(self, event, doc):
+        if self.types is not None and event['type'] not in self.types:
+            return False
+        
+        if self.fields is not None and event['type'] == 'changed':
+            if self.fields.isdisjoint(event['fields']) and self.fields.isdisjoint(event['cleared']):
+                return False
+        
+        if self.query is not None and event['type'] == 'batch':
+            return any(matches(item, self.query) for item in doc)
+        
+        if self.query is not None and (doc is None or not matches(doc, self.query)):
+            return False
+        
+        return True
+    
+    def __push__(self, event, doc = None):
+        '''Adds an event to the queue, applying filters and the overflow policy.'''
+        
+        if not self.__accepts__(event, doc):
+            return
+        
+        if self.overflow == 'coalesce' and event['type'] == 'changed':
+            pending = self._pending_changes.get(event['_id'])
+            if pending is not None:
+                self.__merge__(pending, event)
+                return
+            
+            # Events are shared between queues, so a copy is queued which can be merged into later.
+            event = type(event).shallow(event)
+            self._pending_changes[event['_id']] = event
+        
+        elif self.overflow == 'coalesce' and event['type'] == 'batch':
+            self._pending_changes.clear()
+        
+        elif self.overflow == 'coalesce':
+            # A later change must not be merged into a change queued before this event.
+            self._pending_changes.pop(event['_id'], None)
+        
+        if self.overflow == 'drop_oldest' and self.__full__():
+            self.get_nowait()
+            self.dropped += 1
+        
+        self._pushing = True
+        try:
+            self.put_nowait(event)
+        finally:
+            self._pushing = False
+    
+    def __merge__(self, pending, event):
+        fields = dict(_raw(pending['fields']))
+        for key in event['cleared']:
+            fields.pop(key, None)
+        fields.update(_raw(event['fields']))
+        
+        cleared = [key for key in pending['cleared'] if key not in event['fields']]
+        cleared.extend(key for key in event['cleared'] if key not in cleared)
+        
+        pending['fields'] = DotView(fields) if isinstance(pending['fields'], DotView) else Dotable.shallow(fields)
+        pending['cleared'] = cleared
+        
+        if 'before' in pending and 'before' in event:
+            # The merged change starts from the values before the earlier change and ends with the values after the later one.
+            before = dict(_raw(pending['before']))
+            after = dict(_raw(pending['after']))
+            
+            for key, value in _raw(event['before']).items():
+                if key not in after and key not in before:
+                    before[key] = value
+            
+            for key in event['cleared']:
+                after.pop(key, None)
+            after.update(_raw(event['after']))
+            
+            pending['before'] = DotView(before) if isinstance(pending['before'], DotView) else Dotable.shallow(before)
+            pending['after'] = DotView(after) if isinstance(pending['after'], DotView) else Dotable.shallow(after)
+    
+    @property
+    def maxsize(self):
+        return self._limit
+    
+    def full(self):
+        # put_nowait() checks full(), but events pushed by the Collection must not be refused.
+        return not self._pushing and self.__full__()
+    
+    def __full__(self):
+        return self._limit > 0 and self.qsize() >= self._limit
+    
+    def __blocking__(self):
+        '''Returns True if the client should wait for this queue's reader before reading more messages.'''
+        return self.overflow != 'drop_oldest' and self.__full__()
+    
+    def get_nowait(self):
+        event = super().get_nowait()
+        
+        if self._pending_changes.get(event['_id']) is event:
+            del self._pending_changes[event['_id']]
+        
+        if not self.__full__():
+            self._space.set()
+        
+        return event
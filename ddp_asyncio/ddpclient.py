@@ -1,11 +1,18 @@
 import asyncio
+import collections
 import websockets
+import websockets.frames
+from websockets.extensions.permessage_deflate import ClientPerMessageDeflateFactory
 import random
-import ejson
+import time
 
+from .codec import get_codec
 from .subscription import Subscription
 from .collection import Collection
 from .methodcall import MethodCall
+from .heartbeat import Heartbeat
+from .cache import CollectionCache
+from .stub import MethodStub
 from .exceptions import ConnectionError, NotConnectedError
 
 def ensure_connected(fn):
@@ -23,11 +30,87 @@ class DDPClient:
     '''Manages a connection to a server.
     It takes a URL as the first parameter, the optional second parameter specifies which event loop will be used.
     
+    The codec parameter selects how messages are serialized, see ddp_asyncio.codec. It may be 'ejson' (the default), 'json', 'orjson' or a custom object with dumps() and loads() methods.
+    The built-in codecs all decode Meteor EJSON dates and binary data to datetime and bytes, so switching between them doesn't change the values stored in Collections.
+    
+    If compact_collections is True, Collections store their items in compact mode by default, see Collection.
+    
+    If auto_reconnect is True, the client reconnects by itself when the connection is lost, waiting between reconnect_delay and max_reconnect_delay seconds (with random jitter) between attempts.
+    After reconnecting, the previous session is resumed: active subscriptions are sent again, method calls which have not returned are retried,
+    and Collections are reconciled with the data sent by the server, so that only actual differences are reported as CollectionEvents.
+    
+    If heartbeat_interval is set, the client pings the server every heartbeat_interval seconds and drops the connection once heartbeat_misses pings in a row go unanswered.
+    The round trip times of the most recent rtt_window pings are available through rtt_percentiles().
+    
+    The metrics parameter accepts a ddp_asyncio.metrics.Metrics instance, which collects counters, timings and calls hooks describing the client's activity.
+    
+    The cache parameter accepts the file name of an SQLite database or a ddp_asyncio.cache.CollectionCache, in which the client keeps a copy of its Collections.
+    The cached items are loaded when connecting, before connect() returns, and reported to Collection queues as a batch CollectionEvent.
+    They are then reconciled with the items the server sends, like after reconnecting, so that only actual differences are reported.
+    Reconciling finishes once no subscription is waiting to become ready, so every subscription should be started before waiting for any of them;
+    cached items which no subscription has sent again by then are removed. Changed items are saved every cache_interval seconds, and when disconnect() is called.
+    
+    Outgoing messages are queued and sent by a writer task, which writes up to send_batch_size queued messages to the connection at once.
+    Larger batches mean fewer writes, but each one holds up the event loop for longer, which delays replies to calls made during a burst of subscriptions.
+    Pings and pongs are sent before method calls, and method calls before subscriptions and other messages, so a burst of subscriptions does not hold up calls or heartbeats.
+    The send_queue_depth property is the number of messages waiting to be sent.
+    
+    Identical subscriptions, with the same publication name and parameters, are shared: subscribe() returns the active Subscription instead of subscribing again,
+    and the server is only unsubscribed once unsubscribe() has been called as many times as subscribe(). If sub_linger is set, unsubscribing is delayed by that many seconds,
+    so that subscribing again in the meantime keeps the subscription instead of having the server send its items again. document_counts() returns the number of items a subscription sent while no other subscription was starting.
+    
+    Messages are compressed with the permessage-deflate websocket extension if the server supports it, unless compression is None.
+    compression_level sets the zlib compression level (1 to 9) of messages the client sends; how well received messages are compressed is up to the server.
+    compression_window_bits (9 to 15) limits the size of the compression window in both directions, lower values need less memory on both ends but compress less.
+    Any other options for websockets.connect(), such as max_size, max_queue, read_limit or write_limit, can be given as a dictionary in websocket_options.
+    Note that websockets refuses messages over 1 MiB by default, max_size raises that limit or removes it when None.
+    
     The is_connected property is a boolean which can be used to determine if DDPClient is currently connected to a server.
     '''
     
-    def __init__(self, url, event_loop = None):
+    # The send queue each type of message goes into, messages in lower queues are sent first.
+    _send_priorities = {'pong': 0, 'ping': 0, 'method': 1}
+    
+    def __init__(self, url, event_loop = None, codec = None, compact_collections = False, auto_reconnect = False, reconnect_delay = 1, max_reconnect_delay = 30,
+                 heartbeat_interval = None, heartbeat_misses = 3, rtt_window = 100, metrics = None,
+                 cache = None, cache_interval = 5, send_batch_size = 8, compression = 'deflate', compression_level = None, compression_window_bits = None,
+                 websocket_options = None, sub_linger = 0):
+        if compression not in ('deflate', None):
+            raise ValueError('Unknown compression {!r}.'.format(compression))
+        
         self.url = url
+        
+        self._compression = compression
+        self._compression_level = compression_level
+        self._compression_window_bits = compression_window_bits
+        self._websocket_options = websocket_options or {}
+        
+        self._codec = get_codec(codec)
+        self._compact_collections = compact_collections
+        
+        self._auto_reconnect = auto_reconnect
+        self._reconnect_delay = reconnect_delay
+        self._max_reconnect_delay = max_reconnect_delay
+        self._reconnect_task = None
+        self._closing = False
+        self._session = None
+        self._resyncing = False
+        
+        self._cache = CollectionCache(cache) if isinstance(cache, str) else cache
+        self._cache_interval = cache_interval
+        self._cache_loaded = False
+        self._cache_task = None
+        
+        self._heartbeat = Heartbeat(rtt_window)
+        self._heartbeat_interval = heartbeat_interval
+        self._heartbeat_misses = heartbeat_misses
+        self._heartbeat_task = None
+        
+        self._metrics = metrics
+        if metrics:
+            metrics.gauge('ddp_collection_queue_depth', lambda: self.__queue_depths__(sum))
+            metrics.gauge('ddp_collection_queue_max_depth', lambda: self.__queue_depths__(max))
+            metrics.gauge('ddp_send_queue_depth', lambda: {(): self.send_queue_depth})
 
         self.is_connected = False
         
@@ -40,160 +123,720 @@ class DDPClient:
         self._cols = {}
         self._calls = {}
         
+        # Active subscriptions by publication name and serialized parameters, so identical subscriptions are shared.
+        self._shared_subs = {}
+        self._sub_linger = sub_linger
+        
+        # Method stubs by method name, and the ids of calls whose stubs wrote items which the server has not confirmed yet.
+        self._stubs = {}
+        self._stubbed = set()
+        
+        # Subscriptions which are not ready yet, and subscriptions which have been stopped but not confirmed by a nosub message.
+        # Items added while subscriptions are pending are attributed to them, so unsubscribing can remove the orphaned items in bulk.
+        # _pending_owners and _bulk_pending are only recomputed when an item arrives, see __pending_owners__().
+        self._pending = {}
+        self._pending_owners = None
+        self._bulk_pending = False
+        self._pending_changed = False
+        self._stopping = set()
+        
+        self._send_queues = (collections.deque(), collections.deque(), collections.deque())
+        self._send_batch_size = send_batch_size
+        self._send_event = asyncio.Event()
+        self._writer_task = None
+        
     async def connect(self):
         '''This coroutine establishes a connection to a server.
         It blocks until the connection is established or an exception is raised.
         
         Raises ddp_asyncio.ConnectionError if the server reports a failure (usually caused by incomplatible versions of the DDP protocol.)
         '''
-
-        self._websocket = await websockets.connect(self.url)
+        
+        self._closing = False
+        
+        if self._cache and not self._cache_loaded:
+            await self.__load_cache__()
+        
+        await self.__connect__(False)
+        
+        if self._cache and not self._cache_task:
+            self._cache_task = self._event_loop.create_task(self.__cache_writer__())
+    
+    async def __connect__(self, reconnecting):
+        self._websocket = await websockets.connect(self.url, **self.__websocket_options__())
         
         msg = {'msg': 'connect', 'version': '1', 'support': ['1']}
+        if reconnecting and self._session:
+            msg['session'] = self._session
         
-        await self._websocket.send(ejson.dumps(msg))
+        await self._websocket.send(self._codec.dumps(msg))
 
         while self._websocket.open:
             msg = await self._websocket.recv()
-            msg = ejson.loads(msg)
+            msg = self._codec.loads(msg)
             _type = msg.get('msg')
             
             if _type == 'failed':
                 raise ConnectionError('The server is not compatible with version 1 of the DDP protocol.')
             elif _type == 'connected':
-                # Ensure all Collections are in their default states
-                for col in self._cols.values(): col._data = {}
+                self._session = msg.get('session')
+                
+                if not reconnecting:
+                    # Subscriptions made in a previous session are gone.
+                    self.__forget_subs__()
+                
+                if not reconnecting and not self._cache:
+                    # Ensure all Collections are in their default states
+                    for col in self._cols.values(): col.__reset__()
+                    self._stubbed.clear()
                 
                 self.is_connected = True
                 self._disconnection_event.clear()
+                for queue in self._send_queues: queue.clear()
+                self._writer_task = self._event_loop.create_task(self.__writer__())
                 self._event_loop.create_task(self.__handler__())
+                
+                if self._heartbeat_interval:
+                    self._heartbeat.__reset__()
+                    self._heartbeat_task = self._event_loop.create_task(self.__heartbeat__())
+                
+                if reconnecting:
+                    self.__resume__()
+                elif self._cache:
+                    # The new session has no subscriptions yet, reconciling finishes once the ones started next are ready.
+                    self._pending.clear()
+                    self.__update_pending__()
+                    self.__begin_resync__()
 
                 return
     
+    def __websocket_options__(self):
+        '''Returns the keyword arguments for websockets.connect().'''
+        
+        options = dict(self._websocket_options)
+        level, bits = self._compression_level, self._compression_window_bits
+        
+        if self._compression and (level is not None or bits is not None):
+            # The same settings websockets uses by default, apart from the ones given.
+            compress_settings = {'memLevel': 5}
+            if level is not None: compress_settings['level'] = level
+            
+            deflate = ClientPerMessageDeflateFactory(server_max_window_bits = bits, client_max_window_bits = bits or True, compress_settings = compress_settings)
+            options['extensions'] = list(options.get('extensions', ())) + [deflate]
+            options['compression'] = None
+        
+        else:
+            options['compression'] = self._compression
+        
+        return options
+    
+    def __resume__(self):
+        '''Resends active subscriptions and unfinished method calls after reconnecting, and starts reconciling Collections with the server's data.'''
+        
+        self.__begin_resync__()
+        
+        # The new session knows nothing about subscriptions which were being stopped.
+        self._stopping.clear()
+        self._pending.clear()
+        
+        for sub in self._subs.values():
+            if sub.error: continue
+            
+            self.__send__(sub.__message__())
+            self._pending[sub._id] = sub
+            
+            # Time to ready is measured from resubscribing.
+            sub._started = self._event_loop.time()
+        
+        self.__update_pending__()
+        
+        for c in self._calls.values():
+            if not c._has_result: self.__send__(c._msg)
+        
+        if not self._pending: self.__end_resync__()
+    
+    def __begin_resync__(self):
+        self._resyncing = True
+        for col in self._cols.values(): col.__begin_resync__()
+    
+    def __end_resync__(self):
+        '''Finishes reconciling once no subscription is waiting to become ready.'''
+        
+        self._resyncing = False
+        for col in self._cols.values(): col.__end_resync__()
+        
+        # The server does not resend "updated" for writes made before the connection was lost, but they have now been reconciled.
+        # Stubbed calls which already returned are no longer in _calls, only calls which were resent still wait for the server.
+        for _id in set(self._calls).union(self._stubbed):
+            c = self._calls.get(_id)
+            if not c or c._has_result: self.__method_updated__(_id)
+    
+    async def __reconnect__(self):
+        '''Reconnects to the server, backing off exponentially with random jitter between attempts.
+        Attempts continue until the server has accepted the connection, including when it answers with a failed message.
+        '''
+        
+        delay = self._reconnect_delay
+        
+        while not self._closing:
+            await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+            
+            try:
+                await self.__connect__(True)
+            except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException, ConnectionError):
+                pass
+            
+            # __connect__ also returns if the connection closes before the server has answered.
+            if self.is_connected: return
+            
+            delay = min(delay * 2, self._max_reconnect_delay)
+    
+    async def __heartbeat__(self):
+        '''Pings the server periodically, dropping the connection if too many pings go unanswered.'''
+        
+        while self.is_connected:
+            if self._heartbeat.missed >= self._heartbeat_misses:
+                # The connection is most likely half-open, so there is no point waiting for a clean close.
+                self._websocket.transport.abort()
+                return
+            
+            self.__send__({
+                'msg': 'ping',
+                'id': self._heartbeat.__ping__(self._event_loop.time())
+            })
+            
+            await asyncio.sleep(self._heartbeat_interval)
+    
+    def rtt_percentiles(self, percentiles = (50, 90, 99)):
+        '''Returns a dictionary mapping each requested percentile to the round trip time of recent heartbeat pings, in seconds.
+        Values are None until a heartbeat ping has been answered.
+        '''
+        return self._heartbeat.percentiles(percentiles)
+    
     async def disconnect(self):
         '''Coroutine which disconnects from the server.
-        Does nothing if called while not connected.
+        Does nothing if called while not connected. Stops reconnecting if the client is waiting to reconnect.
         '''
         
+        self._closing = True
+        if self._reconnect_task: self._reconnect_task.cancel()
+        
         if self.is_connected:
             await self._websocket.close()
+        
+        if self._cache_task:
+            self._cache_task.cancel()
+            self._cache_task = None
+            await self.__save_cache__()
+    
+    async def __load_cache__(self):
+        cached = await self._event_loop.run_in_executor(self._cache.executor, self._cache.load, self._codec)
+        
+        for name, items in cached.items():
+            col = self.get_collection(name)
+            col.__load__(items)
+            col._dirty = set()
+        
+        self._cache_loaded = True
+    
+    async def __save_cache__(self):
+        '''Saves the items changed since the last save to the cache.'''
+        
+        updated, removed = [], []
+        
+        for name, col in self._cols.items():
+            if not col._dirty: continue
+            
+            for _id in col._dirty:
+                doc = col._data.get(_id)
+                if doc is None:
+                    removed.append((name, _id))
+                else:
+                    updated.append((name, _id, self._codec.dumps(doc)))
+            
+            col._dirty = set()
+        
+        if updated or removed:
+            await self._event_loop.run_in_executor(self._cache.executor, self._cache.save, updated, removed)
+    
+    async def __cache_writer__(self):
+        while True:
+            await asyncio.sleep(self._cache_interval)
+            await self.__save_cache__()
     
     async def disconnection(self):
-        '''Coroutine that blocks while connected to the server.'''
+        '''Coroutine that blocks while connected to the server.
+        If auto_reconnect is enabled, this returns whenever the connection is lost, even though the client will reconnect.
+        '''
         await self._disconnection_event.wait()
     
     @ensure_connected
-    async def subscribe(self, name, *params):
+    async def subscribe(self, name, *params, bulk = False):
         '''Coroutine that subscribes to a publication.
         subscribe() returns a Subscription object which can be used to monitor the status of the subscription.
         
+        If bulk is True, the items sent during the subscription's initial sync are held back and only stored once the subscription becomes ready,
+        and Collection queues then receive a single batch CollectionEvent instead of one added event per item.
+        Items are only held back while every subscription which is not ready yet is a bulk subscription.
+        
+        If an identical subscription is active, or lingering after being unsubscribed, it is shared and returned instead, see DDPClient.
+        Each call to subscribe() should be matched by a call to unsubscribe().
+        
         Raises ddp_asyncio.NotConnectedError if called while not connected to a server.
         '''
         
-        sub = Subscription(name)
+        sub = self.__subscribe__(name, params, bulk)
+        self.__update_pending__()
+        
+        return sub
+    
+    @ensure_connected
+    async def subscribe_many(self, subscriptions, bulk = False):
+        '''Coroutine that subscribes to several publications at once, and returns a list of Subscription objects in the same order.
+        
+        Each subscription is given as a publication name, or as a tuple of a publication name followed by its parameters, e.g. ('todos.inList', {'listId': _id}).
+        The sub messages are queued together and written to the connection in as few writes as possible. See subscribe() for the bulk argument.
+        
+        Raises ddp_asyncio.NotConnectedError if called while not connected to a server.
+        '''
+        
+        subs = []
+        
+        for spec in subscriptions:
+            name, *params = (spec,) if isinstance(spec, str) else spec
+            subs.append(self.__subscribe__(name, params, bulk))
+        
+        self.__update_pending__()
+        
+        return subs
+    
+    def __subscribe__(self, name, params, bulk):
+        '''Returns the active subscription with the same name and parameters, or starts a new one. The caller updates the pending subscriptions.'''
+        
+        key = (name, self._codec.dumps(list(params)))
+        sub = self._shared_subs.get(key)
+        
+        if sub:
+            sub._refs += 1
+            if sub._linger:
+                sub._linger.cancel()
+                sub._linger = None
+            
+            return sub
+        
+        sub = Subscription(name, params, bulk)
+        sub._key = key
+        self._shared_subs[key] = sub
         self._subs[sub._id] = sub
-
-        await self._websocket.send(ejson.dumps({
-            'msg': 'sub',
-            'id': sub._id,
-            'name': name,
-            'params': params
-        }))
+        self._pending[sub._id] = sub
+        
+        sub._started = self._event_loop.time()
+        self.__send__(sub.__message__())
         
         return sub
     
+    def __shared_sub__(self, name, params):
+        '''Returns the active subscription with the given name and parameters, or None.'''
+        return self._shared_subs.get((name, self._codec.dumps(list(params))))
+    
     @ensure_connected
     async def unsubscribe(self, sub):
         '''Coroutine that unsubscribes from a publication.
         
+        A shared subscription is only stopped once unsubscribe() has been called as many times as subscribe(), after the client's sub_linger delay if it has one.
+        Items which only this subscription published are removed together once the server confirms the unsubscription,
+        and Collection queues receive a single batch CollectionEvent instead of one removed event per item.
+        
         Raises ddp_asyncio.NotConnectedError if called while not connected to a server.
         '''
         
-        await self._websocket.send(ejson.dumps({
+        sub._refs = max(sub._refs - 1, 0)
+        if sub._refs or sub._linger or sub._id not in self._subs: return
+        
+        if self._sub_linger:
+            sub._linger = self._event_loop.call_later(self._sub_linger, self.__stop__, sub)
+        else:
+            self.__stop__(sub)
+    
+    def __stop__(self, sub):
+        '''Unsubscribes from a subscription which is no longer used.'''
+        
+        sub._linger = None
+        
+        # Forget the subscription, so it isn't resent after reconnecting.
+        self._subs.pop(sub._id, None)
+        if self._shared_subs.get(sub._key) is sub: del self._shared_subs[sub._key]
+        
+        if self._pending.pop(sub._id, None): self.__update_pending__()
+        
+        # A lingering subscription may run out while disconnected, the new session does not know about it.
+        if not self.is_connected: return
+        
+        self._stopping.add(sub._id)
+        self.__send__({
             'msg': 'unsub',
             'id': sub._id
-        }))
+        })
+    
+    def __forget_subs__(self):
+        for sub in self._subs.values():
+            if sub._linger: sub._linger.cancel()
+        
+        self._subs = {}
+        self._shared_subs = {}
     
-    def get_collection(self, name):
-        '''Retrieve an existing Collection by name. If the Collection does not exist it will be created.'''
+    def document_counts(self, sub):
+        '''Returns a dictionary mapping the name of each Collection to the number of its items which a subscription sent.
+        
+        DDP does not say which subscription published an item, so an item is only counted if the subscription was the only one not ready yet when the item was added.
+        Items added while other subscriptions were also waiting to become ready could have come from any of them and are not counted,
+        neither are items published by a subscription after it became ready, or by another subscription first.
+        '''
+        
+        counts = {}
+        for name, col in self._cols.items():
+            count = col.__owned__(sub._id)
+            if count: counts[name] = count
+        
+        return counts
+    
+    def get_collection(self, name, compact = None, diffs = None):
+        '''Retrieve an existing Collection by name. If the Collection does not exist it will be created.
+        
+        The compact argument overrides the client's compact_collections setting when a new Collection is created.
+        If diffs is set, it turns recording the previous and new values of changed keys in CollectionEvents on or off, see Collection.
+        '''
         c = self._cols.get(name)
 
         if not c:
-            c = Collection(name)
+            c = Collection(name, self._compact_collections if compact is None else compact)
+            c._metrics = self._metrics
+            if self._cache: c._dirty = set()
             self._cols[name] = c
 
+        if diffs is not None: c._diffs = diffs
+        
         return c
     
+    def stub(self, method, fn):
+        '''Registers a client-side stub for a method, which simulates the method's writes so that they are visible without waiting for the server. Setting fn to None removes the stub.
+        
+        When the method is called, fn is called first, with a ddp_asyncio.stub.MethodStub followed by the call's parameters, and writes items through the MethodStub.
+        The writes are applied to the client's Collections and reported as CollectionEvents right away. Until the server reports that the method's writes have been sent,
+        the server's own messages about the written items are kept aside. Then each item is reset to the server's version, reporting only the differences from the optimistic writes,
+        which undoes them if the method failed or wrote something else. If fn raises an exception, its writes are undone and the method is not called.
+        '''
+        
+        if fn is None:
+            self._stubs.pop(method, None)
+        else:
+            self._stubs[method] = fn
+    
     @ensure_connected
-    async def call(self, method, *params):
+    async def call(self, method, *params, wait_for_updated = False):
         '''This coroutine calls a remote method on the server and returns the result.
         
+        If wait_for_updated is True, call() only returns once the server has also reported that all writes made by the method have been sent,
+        so their effects are already visible in the client's Collections.
+        
+        If a stub is registered for the method with stub(), its optimistic writes are applied before the call is sent.
+        
         Raises a ddp_asyncio.RemoteMethodError if the server replies with an error.
         Raises ddp_asyncio.NotConnectedError if called while not connected to a server.
         '''
         
-        c = MethodCall()
-        self._calls[c._id] = c
-
-        await self._websocket.send(ejson.dumps({
+        c = MethodCall(self._event_loop, wait_for_updated)
+        c._started = self._event_loop.time()
+        
+        stub = self._stubs.get(method)
+        if stub:
+            try:
+                stub(MethodStub(self, c._id), *params)
+            except BaseException:
+                self.__method_updated__(c._id)
+                raise
+        
+        c._msg = {
             'msg': 'method',
             'method': method,
             'params': params,
             'id': c._id
-        }))
+        }
+
+        self.__send__(c._msg)
+        self._calls[c._id] = c
         
         return await c.__wait__()
     
-    async def __pong__(self, _id):
+    @property
+    def send_queue_depth(self):
+        return sum(len(queue) for queue in self._send_queues)
+    
+    def __send__(self, msg):
+        '''Queues a message to be sent to the server by the writer task.'''
+        data = self._codec.dumps(msg)
+        if self._metrics: self._metrics.__sent__(msg, len(data))
+        
+        self._send_queues[self._send_priorities.get(msg['msg'], 2)].append(data)
+        self._send_event.set()
+    
+    def __update_pending__(self):
+        # Rebuilding the owners set takes O(n) time in the number of pending subscriptions, so it is left until an item arrives
+        # rather than being done for each of a burst of ready messages.
+        self._pending_changed = True
+    
+    def __pending_owners__(self):
+        '''Returns the set of pending subscriptions which items added now are attributed to, and updates _bulk_pending.'''
+        
+        if self._pending_changed:
+            self._pending_changed = False
+            
+            # Items added while the same subscriptions are pending share one owners set.
+            self._pending_owners = frozenset(self._pending) if self._pending else None
+            self._bulk_pending = bool(self._pending) and all(sub._bulk for sub in self._pending.values())
+        
+        return self._pending_owners
+    
+    def __flush__(self, subs, stopped = None):
+        '''Stores the items held back for subscriptions which became ready or failed, and removes the items of a stopped subscription.'''
+        
+        for col in list(self._cols.values()):
+            if col._buffered: col.__flush__(subs)
+            if stopped and col._deferred_removals: col.__flush_removals__(stopped)
+    
+    def __blocked__(self):
+        return any(col._blocked for col in self._cols.values())
+    
+    async def __drain__(self):
+        '''Waits until no Collection queue with a blocking overflow policy is over its limit.'''
+        
+        for col in list(self._cols.values()):
+            if col._blocked: await col.__drain__()
+    
+    def __method_updated__(self, _id):
+        '''Handles the server reporting that a method's writes have been sent.'''
+        
+        if _id in self._stubbed:
+            self._stubbed.discard(_id)
+            for col in list(self._cols.values()):
+                if col._server_docs: col.__unstub__(_id)
+        
+        c = self._calls.get(_id)
+        if c and c.__updated__():
+            self.__call_complete__(c)
+    
+    def __call_complete__(self, c):
+        del self._calls[c._id]
+        
+        if self._metrics:
+            self._metrics.__call_complete__(c._msg['method'], self._event_loop.time() - c._started, c._error)
+    
+    def __queue_depths__(self, aggregate):
+        return {(('collection', name),): aggregate([q.qsize() for q in col.__all_queues__()] or [0]) for name, col in self._cols.items()}
+    
+    async def __writer__(self):
+        '''Sends queued messages to the server.
+        Messages queued during one iteration of the event loop are framed together and written to the connection at once, rather than each caller awaiting its own send.
+        Each write takes the highest priority messages first, so messages queued while a long queue is being written can overtake lower priority ones.
+        '''
+        
+        websocket = self._websocket
+        
+        while websocket.open:
+            await self._send_event.wait()
+            self._send_event.clear()
+            
+            while self.send_queue_depth:
+                batch = []
+                for queue in self._send_queues:
+                    while queue and len(batch) < self._send_batch_size:
+                        batch.append(queue.popleft())
+                
+                try:
+                    await self.__write__(websocket, batch)
+                except websockets.exceptions.ConnectionClosed:
+                    return
+                
+                # Let other tasks queue messages before the next write, so they can be sent ahead of the rest of a long queue.
+                await asyncio.sleep(0)
+    
+    async def __write__(self, websocket, batch):
+        '''Writes a batch of messages to the connection with a single write, waiting until the connection's write buffer has drained.
+        Frames are written to the transport of the legacy websockets protocol directly, connections without one send each message with send().
+        '''
+        
+        if len(batch) == 1:
+            return await websocket.send(batch[0])
+        
+        if not all(hasattr(websocket, name) for name in ('transport', 'drain', 'ensure_open', 'extensions')):
+            for data in batch:
+                await websocket.send(data)
+            return
+        
+        await websocket.ensure_open()
+        
+        frames = []
+        for data in batch:
+            if isinstance(data, str):
+                frame = websockets.frames.Frame(websockets.frames.Opcode.TEXT, data.encode())
+            else:
+                frame = websockets.frames.Frame(websockets.frames.Opcode.BINARY, data)
+            
+            frames.append(frame.serialize(mask = True, extensions = websocket.extensions))
+        
+        websocket.transport.write(b''.join(frames))
+        await websocket.drain()
+    
+    def __pong__(self, _id):
         '''Respond to a ping from the server.'''
-        await self._websocket.send(ejson.dumps({
+        self.__send__({
             'msg': 'pong',
             'id': _id
-        }))
+        })
                 
     async def __handler__(self):
-        '''Handles messages received from the server'''
-
-        while self._websocket.open:
-            try:
-                msg = await self._websocket.recv()
-            except websockets.exceptions.ConnectionClosed:
-                break
-            
-            if not msg: continue
+        '''Handles messages received from the server.
+        If handling a message raises an exception, the connection is dropped, and reconnected if auto_reconnect is set, rather than left without a handler.
+        '''
 
-            msg = ejson.loads(msg)
-            _type = msg.get('msg')
-            
-            if _type == 'ping':
-                await self.__pong__(msg.get('id'))
+        try:
+            while self._websocket.open:
+                try:
+                    msg = await self._websocket.recv()
+                except websockets.exceptions.ConnectionClosed:
+                    break
                 
-            elif _type == 'ready':
-                for _id in msg['subs']:
-                    sub = self._subs.get(_id)
-                    if sub: sub.__ready__()
-            
-            elif _type == 'nosub':
-                sub = self._subs.get(msg['id'])
-                if sub: sub.__error__(msg.get('error', 'Denied by server for unspecified reason.'))
+                if not msg: continue
 
-            elif _type == 'added':
-                col = self.get_collection(msg['collection'])
-                col.__added__(msg['id'], msg['fields'])
-                    
-            elif _type == 'changed':
-                col = self.get_collection(msg['collection'])
+                metrics = self._metrics
+                if metrics:
+                    size = len(msg)
+                    started = time.perf_counter()
+                
+                msg = self._codec.loads(msg)
+                
+                if metrics: decoded = time.perf_counter()
+                
+                blocked = self.__dispatch__(msg)
+                
+                if metrics: metrics.__received__(msg, size, decoded - started, time.perf_counter() - decoded)
+                
+                if blocked: await self.__drain__()
+        
+        finally:
+            if self._websocket.open: self._websocket.transport.abort()
+            
+            self._writer_task.cancel()
+            if self._heartbeat_task: self._heartbeat_task.cancel()
+            self.is_connected = False
+            self._disconnection_event.set()
+            
+            if self._auto_reconnect and not self._closing:
+                self._reconnect_task = self._event_loop.create_task(self.__reconnect__())
+    
+    def __dispatch__(self, msg):
+        '''Handles a decoded message.
+        
+        Dispatching never waits: replies such as pongs are queued for the writer task, and method results are set on their futures directly,
+        so a slow or backed up connection cannot hold up the messages received after them.
+        Returns True if a Collection queue with a blocking overflow policy is over its limit, in which case the caller waits for it to drain before handling further messages.
+        '''
+        
+        _type = msg.get('msg')
+        metrics = self._metrics
+        
+        if _type == 'ping':
+            self.__pong__(msg.get('id'))
+        
+        elif _type == 'pong':
+            self._heartbeat.__pong__(msg.get('id'), self._event_loop.time())
+        
+        elif _type == 'ready':
+            if self._pending:
+                for _id in msg['subs']: self._pending.pop(_id, None)
+                self.__update_pending__()
+            
+            self.__flush__(msg['subs'])
+            
+            for _id in msg['subs']:
+                sub = self._subs.get(_id)
+                if sub:
+                    sub.__ready__()
+                    if metrics: metrics.__subscription_ready__(sub._name, self._event_loop.time() - sub._started)
+        
+            if self._resyncing and not self._pending: self.__end_resync__()
+            return self.__blocked__()
+        
+        elif _type == 'nosub':
+            if self._pending.pop(msg['id'], None): self.__update_pending__()
+            
+            stopped = msg['id'] if msg['id'] in self._stopping else None
+            self._stopping.discard(msg['id'])
+            self.__flush__((msg['id'],), stopped)
+            
+            # The server stopped the subscription, so it is neither shared nor resent after reconnecting.
+            sub = self._subs.pop(msg['id'], None)
+            if sub:
+                if sub._linger: sub._linger.cancel()
+                if self._shared_subs.get(sub._key) is sub: del self._shared_subs[sub._key]
+                sub.__error__(msg.get('error', 'Denied by server for unspecified reason.'))
+        
+            if self._resyncing and not self._pending: self.__end_resync__()
+            return self.__blocked__()
+        
+        elif _type == 'added':
+            col = self.get_collection(msg['collection'])
+            owners = self.__pending_owners__()
+            
+            if msg['id'] in col._server_docs:
+                col.__shadow__('added', msg['id'], msg['fields'], owners = owners)
+            elif self._bulk_pending and not self._resyncing:
+                col.__buffer__(msg['id'], msg['fields'], owners)
+            else:
+                col.__added__(msg['id'], msg['fields'], owners)
+                return bool(col._blocked)
+        
+        elif _type == 'addedBefore':
+            col = self.get_collection(msg['collection'])
+            owners = self.__pending_owners__()
+            
+            if msg['id'] in col._server_docs:
+                col.__shadow__('added', msg['id'], msg['fields'], owners = owners)
+            else:
+                # Ordered items are never held back for bulk subscriptions, as their positions depend on the items sent before them.
+                col.__added_before__(msg['id'], msg['fields'], msg.get('before'), owners)
+                return bool(col._blocked)
+        
+        elif _type == 'movedBefore':
+            col = self.get_collection(msg['collection'])
+            col.__moved_before__(msg['id'], msg.get('before'))
+            return bool(col._blocked)
+        
+        elif _type == 'changed':
+            col = self.get_collection(msg['collection'])
+            
+            if msg['id'] in col._server_docs:
+                col.__shadow__('changed', msg['id'], msg.get('fields', {}), msg.get('cleared', []))
+            else:
                 col.__changed__(msg['id'], msg.get('fields', {}), msg.get('cleared', []))
-                    
-            elif _type == 'removed':
-                col = self.get_collection(msg['collection'])
-                col.__removed__(msg['id'])
-                    
-            elif _type == 'result':
-                c = self._calls.get(msg['id'])
-                if c:
-                    await c.__result__(msg.get('error'), msg.get('result'))
-                    del self._calls[msg['id']]
+                return bool(col._blocked)
         
-        self.is_connected = False
-        self._disconnection_event.set()
+        elif _type == 'removed':
+            col = self.get_collection(msg['collection'])
+            
+            if msg['id'] in col._server_docs:
+                col.__shadow__('removed', msg['id'])
+            else:
+                col.__removed__(msg['id'], self._stopping)
+                return bool(col._blocked)
+        
+        elif _type == 'result':
+            c = self._calls.get(msg['id'])
+            if c and c.__result__(msg.get('error'), msg.get('result')):
+                self.__call_complete__(c)
+        
+        elif _type == 'updated':
+            for _id in msg['methods']:
+                self.__method_updated__(_id)
+            
+            return self.__blocked__()
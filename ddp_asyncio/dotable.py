@@ -1,11 +1,20 @@
 '''Dotable class for using period attribute accessor syntax on Python dicts
 
 Created by Andy Hayden: https://hayd.github.io/2013/dotable-dictionaries
+
+Document, DotView and DotList provide the same attribute access for compact Collections, wrapping nested values lazily instead of copying them.
 '''
 
+import collections.abc
+
 class Dotable(dict):
 
-    __getattr__= dict.__getitem__
+    def __getattr__(self, key):
+        # Raising AttributeError rather than KeyError keeps hasattr(), copy and pickle working.
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key)
 
     def __init__(self, d):
         self.update(**dict((k, self.parse(v))
@@ -19,3 +28,82 @@ class Dotable(dict):
             return [cls.parse(i) for i in v]
         else:
             return v
+    
+    @classmethod
+    def shallow(cls, d):
+        '''Creates a Dotable from d without parsing or copying its values.'''
+        self = cls.__new__(cls)
+        dict.update(self, d)
+        return self
+
+def wrap(v):
+    '''Wraps dicts and lists in read-only views which allow attribute access, without copying them.'''
+    if isinstance(v, dict):
+        return DotView(v)
+    elif isinstance(v, list):
+        return DotList(v)
+    else:
+        return v
+
+class Document(dict):
+    '''A dict which allows attribute access to its items, nested dicts and lists are wrapped when accessed as attributes.'''
+    
+    __slots__ = ()
+    
+    def __getattr__(self, key):
+        try:
+            return wrap(self[key])
+        except KeyError:
+            raise AttributeError(key)
+
+class DotView(collections.abc.Mapping):
+    '''A read-only view of a dict which allows attribute access to its items.'''
+    
+    __slots__ = ('_dict',)
+    
+    def __init__(self, d):
+        self._dict = d
+    
+    def __getitem__(self, key):
+        return wrap(self._dict[key])
+    
+    def __getattr__(self, key):
+        # Special attributes are looked up by copy and pickle before _dict has been set.
+        if key.startswith('__'):
+            raise AttributeError(key)
+        
+        try:
+            return wrap(self._dict[key])
+        except KeyError:
+            raise AttributeError(key)
+    
+    def __len__(self):
+        return len(self._dict)
+    
+    def __iter__(self):
+        return iter(self._dict)
+    
+    def __repr__(self):
+        return repr(self._dict)
+
+class DotList(collections.abc.Sequence):
+    '''A read-only view of a list whose items are wrapped when accessed.'''
+    
+    __slots__ = ('_list',)
+    
+    def __init__(self, l):
+        self._list = l
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return DotList(self._list[index])
+        return wrap(self._list[index])
+    
+    def __len__(self):
+        return len(self._list)
+    
+    def __eq__(self, other):
+        return list(self) == list(other) if isinstance(other, (list, DotList)) else NotImplemented
+    
+    def __repr__(self):
+        return repr(self._list)
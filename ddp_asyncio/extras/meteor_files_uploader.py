@@ -1,7 +1,11 @@
 import os
+import io
+import collections
 import uuid
 import math
+import mmap
 import base64
+import threading
 
 import asyncio
 import aiohttp
@@ -12,34 +16,217 @@ import urllib.parse
 class MeteorFilesException(Exception): pass
 
 class MeteorFilesUploader:
-    '''Uploads files to a Meteor-Files collection via HTTP (https://github.com/VeliovGroup/Meteor-Files)'''
+    '''Uploads files to a Meteor-Files collection via HTTP (https://github.com/VeliovGroup/Meteor-Files)
     
-    def __init__(self, client, collection_name):
+    The chunk_size argument sets the size of each uploaded chunk in bytes, and concurrency sets how many chunks of a file are uploaded at the same time.
+    Chunks are read and encoded in a thread pool, the executor argument may be set to a concurrent.futures.Executor to use instead of the event loop's default.
+    
+    All uploads share one HTTP session, which is closed by the close() coroutine.
+    
+    The uploader also manages its uploads as a group:
+        max_uploads limits how many files are uploaded at the same time, further uploads wait for a free slot.
+        max_bandwidth limits the combined upload rate of all files, in bytes per second.
+        Failed chunk uploads are retried up to retries times, waiting retry_delay seconds before the first retry and twice as long before each following one.
+    The uploads property contains every upload which has not completed yet. Uploads which failed can be continued with resume_all().
+    '''
+    
+    def __init__(self, client, collection_name, chunk_size = 1048576, concurrency = 4, executor = None,
+                 max_uploads = None, max_bandwidth = None, retries = 5, retry_delay = 0.5):
         self.client = client
         self.collection_name = collection_name
+        
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.executor = executor
+        
+        self.max_bandwidth = max_bandwidth
+        self.retries = retries
+        self.retry_delay = retry_delay
+        
+        self.uploads = set()
+        
+        self._session = None
+        self._upload_slots = asyncio.Semaphore(max_uploads) if max_uploads else None
+        self._bandwidth_free_at = 0
     
-    def start_upload(self, file_or_path, name = None, mimetype = None, meta = {}, loop = asyncio.get_event_loop()):
+    def start_upload(self, file_or_path, name = None, mimetype = None, meta = {}, loop = None, chunk_size = None, concurrency = None, size = None):
         '''Starts the upload of a file to this uploader's Meteor-Files collection.
         
-        The file_or_path argument may be a file-like object or a file path. If a file-like object is provided, the name argument must be provided as well.
+        The file_or_path argument may be a file path, a file-like object, a bytes-like object (bytes, bytearray or memoryview), an asyncio.StreamReader or an async iterator of bytes.
+        If anything but a file path is provided, the name argument must be provided as well.
+        Bytes-like objects are uploaded without being copied. Streams and async iterators are uploaded in chunks as data arrives;
+        if their size is not passed as the size argument, the final size is sent along with the last request.
         If a mimetype is not provided it will be guessed from the file's extension. A MeteorFilesException will be raised if mimetype cannot be determined.
         The meta property may be any JSON-encodable object and will be passed to the server along with the file.
         The loop property may be set to an ayncio event loop. If not set, the default will be used.
+        The chunk_size and concurrency arguments override the uploader's settings for this upload.
         
         Returns an Upload object which can be used to monitor the upload.
         '''
         
-        return Upload(self, file_or_path, name, mimetype, meta, loop)
+        upload = Upload(self, file_or_path, name, mimetype, meta, loop or asyncio.get_event_loop(),
+                        chunk_size or self.chunk_size, concurrency or self.concurrency, size)
+        self.uploads.add(upload)
+        return upload
+    
+    def resume_all(self):
+        '''Resumes every upload which failed, for example after the network connection has been restored.'''
+        for upload in list(self.uploads):
+            upload.resume()
+    
+    async def close(self):
+        '''Coroutine which closes the HTTP session shared by this uploader's uploads.'''
+        
+        if self._session:
+            await self._session.close()
+            self._session = None
+    
+    def __session__(self):
+        if not self._session or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        
+        return self._session
+    
+    async def __throttle__(self, size, loop):
+        '''Waits until sending size more bytes keeps the combined upload rate within max_bandwidth.'''
+        
+        if not self.max_bandwidth:
+            return
+        
+        now = loop.time()
+        start = max(now, self._bandwidth_free_at)
+        self._bandwidth_free_at = start + size / self.max_bandwidth
+        
+        if start > now:
+            await asyncio.sleep(start - now)
+
+class FileSource:
+    '''Reads chunks from a seekable file at any offset. The file is memory-mapped if possible.'''
+    
+    random_access = True
+    
+    def __init__(self, file):
+        self.file = file
+        self._lock = threading.Lock()
+        
+        try:
+            self.size = os.stat(file.fileno()).st_size
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            self.size = file.seek(0, io.SEEK_END)
+        
+        try:
+            self._mmap = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+        except (AttributeError, ValueError, OSError, io.UnsupportedOperation):
+            # Empty files and files which can't be mapped are read with seek() and read() instead.
+            self._mmap = None
+    
+    def read_chunk(self, offset, size):
+        if self._mmap is not None:
+            with memoryview(self._mmap)[offset:offset + size] as chunk:
+                return base64.b64encode(chunk)
+        
+        with self._lock:
+            self.file.seek(offset)
+            return base64.b64encode(self.file.read(size))
+    
+    def close(self):
+        if self._mmap is not None: self._mmap.close()
+        self.file.close()
+
+class BufferSource:
+    '''Reads chunks from a bytes-like object, through a memoryview so no data is copied.'''
+    
+    random_access = True
+    
+    def __init__(self, data):
+        self._view = memoryview(data).cast('B')
+        self.size = len(self._view)
+    
+    def read_chunk(self, offset, size):
+        return base64.b64encode(self._view[offset:offset + size])
+    
+    def close(self):
+        self._view.release()
+
+class StreamSource:
+    '''Reads chunks in order from an asyncio.StreamReader or an async iterator of bytes.'''
+    
+    random_access = False
+    
+    def __init__(self, stream, size):
+        self.size = size
+        
+        if isinstance(stream, asyncio.StreamReader):
+            self._read = stream.read
+            self._iterator = None
+        else:
+            self._read = None
+            self._iterator = stream.__aiter__()
+        
+        self._buffer = bytearray()
+        self._eof = False
+    
+    async def next_chunk(self, size):
+        '''Returns the next chunk of up to size bytes, or None once the stream is exhausted.'''
+        
+        while len(self._buffer) < size and not self._eof:
+            if self._read:
+                data = await self._read(size - len(self._buffer))
+                
+                # Only StreamReader.read() returns b'' at the end of the stream, an iterator may also yield empty chunks along the way.
+                if not data:
+                    self._eof = True
+                    continue
+            else:
+                try:
+                    data = await self._iterator.__anext__()
+                except StopAsyncIteration:
+                    self._eof = True
+                    continue
+            
+            if not data:
+                continue
+            elif not self._buffer and len(data) == size:
+                # Chunks which arrive at exactly the right size are used without copying them.
+                return data
+            else:
+                self._buffer += data
+        
+        if not self._buffer:
+            return None
+        
+        chunk = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return chunk
+    
+    def close(self):
+        pass
+
+def get_source(file_or_path, size):
+    if isinstance(file_or_path, str):
+        return FileSource(open(file_or_path, 'rb'))
+    elif isinstance(file_or_path, (bytes, bytearray, memoryview)):
+        return BufferSource(file_or_path)
+    elif isinstance(file_or_path, asyncio.StreamReader) or hasattr(file_or_path, '__aiter__'):
+        return StreamSource(file_or_path, size)
+    else:
+        return FileSource(file_or_path)
 
 class Upload:
     '''Tracks an in-progress upload.
     
     The _id property contains the uploaded file's ID in the target collection.
-    The progress property states the progress of the upload as a float between 0 and 1.
+    The progress property states the progress of the upload as a float between 0 and 1. It stays at 0 until completion for streams of unknown size.
+    The uploaded property states how many bytes have been uploaded.
     The completed property states if the upload is complete as a boolean.
+    The error property contains the exception which caused the upload to fail, or None.
+    
+    Chunks which the server has acknowledged are remembered, so resume() continues a failed upload without sending them again.
+    For streams, chunks which were read but not acknowledged are kept in memory until they are.
     '''
     
-    def __init__(self, uploader, file_or_path, name, mimetype, meta, loop):
+    def __init__(self, uploader, file_or_path, name, mimetype, meta, loop, chunk_size, concurrency, size = None):
+        self.uploader = uploader
         self.client = uploader.client
         self.collection_name = uploader.collection_name
         
@@ -47,13 +234,9 @@ class Upload:
         
         if type(file_or_path) == str:
             if not name: name = os.path.basename(file_or_path)
-            self.file = open(file_or_path, 'rb')
         
-        else:
-            if not name:
-                raise MeteorFilesException('The name argument must be provided when calling upload() with a file-like object.')
-            
-            self.file = file_or_path
+        elif not name:
+            raise MeteorFilesException('The name argument must be provided when calling upload() with anything but a file path.')
         
         self.name = name
         
@@ -63,70 +246,216 @@ class Upload:
                 raise MeteorFilesException('Could not determine mimetype of the specified file.')
         
         self.mimetype = mimetype
-
-        self.filesize = os.stat(self.file.fileno()).st_size
+        
+        self._source = get_source(file_or_path, size)
+        self.filesize = self._source.size
 
         self.meta = meta
+        
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
 
         self.progress = 0
+        self.uploaded = 0
         self.complete = False
+        self.error = None
         
         self._complete_event = asyncio.Event()
         self._canceled = False
         
+        self._loop = loop
+        
+        self._upload_info = None
+        self._acked = set()
+        
+        # Stream uploads number chunks as they are read, and keep them until they have been acknowledged.
+        self._next_chunk_id = 0
+        self._unacked = collections.OrderedDict()
+        self._stream_lock = asyncio.Lock()
+        
         self._upload_task = loop.create_task(self.__do_upload__())
     
     async def wait(self):
-        '''Coroutine that waits until this upload is complete.'''
-        await self._complete_event()        
+        '''Coroutine that waits until this upload is complete.
+        If the upload failed, the exception which caused it is raised.
+        '''
+        
+        await self._complete_event.wait()
+        if self.error: raise self.error
+    
+    def resume(self):
+        '''Restarts a failed upload, only chunks which the server has not acknowledged yet are sent.
+        Does nothing if the upload is complete or still running.
+        '''
+        
+        if self.complete or not self._upload_task.done():
+            return
+        
+        self.error = None
+        self._complete_event.clear()
+        self._upload_task = self._loop.create_task(self.__do_upload__())
+    
+    def __chunk_count__(self):
+        return int(math.ceil(self.filesize / self.chunk_size)) or 1
+    
+    async def __next_chunk__(self, retry):
+        '''Returns the id and encoded data of the next chunk of a stream, or None once the stream is exhausted.
+        Chunks which were read but not acknowledged before the upload failed are returned first.
+        '''
+        
+        async with self._stream_lock:
+            if retry:
+                chunk_id, data = retry.popitem(last = False)
+            else:
+                data = await self._source.next_chunk(self.chunk_size)
+                if data is None: return None
+                
+                chunk_id = self._next_chunk_id
+                self._next_chunk_id += 1
+                self._unacked[chunk_id] = data
+        
+        return chunk_id, await self._loop.run_in_executor(self.uploader.executor, base64.b64encode, data)
+    
+    async def __upload_stream_chunks__(self, session, upload_uri, retry):
+        while True:
+            chunk = await self.__next_chunk__(retry)
+            if chunk is None: return
+            
+            chunk_id, data = chunk
+            await self.__post_chunk__(session, upload_uri, chunk_id, data)
+            
+            self.uploaded += len(self._unacked.pop(chunk_id))
+            if self.filesize: self.progress = min(len(self._acked) / self.__chunk_count__(), 1)
+    
+    async def __upload_chunks__(self, session, upload_uri, chunk_ids):
+        chunk_count = self.__chunk_count__()
+        
+        for chunk_id in chunk_ids:
+            offset = chunk_id * self.chunk_size
+            data = await self._loop.run_in_executor(self.uploader.executor, self._source.read_chunk, offset, self.chunk_size)
+            
+            await self.__post_chunk__(session, upload_uri, chunk_id, data)
+            
+            self.uploaded += min(self.chunk_size, self.filesize - offset)
+            self.progress = len(self._acked) / chunk_count
+    
+    async def __post_chunk__(self, session, upload_uri, chunk_id, data):
+        await self.__post__(session, upload_uri, data, {
+            'x-eof': '0',
+            'x-fileId': self._id,
+            'x-chunkId': str(chunk_id + 1),
+            'Content-Type': self.mimetype
+        })
+        
+        self._acked.add(chunk_id)
+    
+    async def __post__(self, session, upload_uri, data, headers):
+        '''Posts a chunk, retrying with exponential backoff if the request fails or the server reports an error.'''
+        
+        delay = self.uploader.retry_delay
+        
+        for attempt in range(self.uploader.retries + 1):
+            await self.uploader.__throttle__(len(data), self._loop)
+            
+            try:
+                async with session.post(upload_uri, data = data, headers = headers) as response:
+                    if response.status >= 500:
+                        response.raise_for_status()
+                    elif response.status >= 400:
+                        raise MeteorFilesException('Upload of chunk {} was rejected with HTTP status {}.'.format(headers.get('x-chunkId', 'EOF'), response.status))
+                    
+                    return
+            
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == self.uploader.retries: raise
+            
+            await asyncio.sleep(delay)
+            delay *= 2
     
     async def __do_upload__(self):
-        chunk_size = 1048576 # No idea.
-        chunk_count = int(math.ceil(self.filesize / chunk_size)) or 1
-        
-        upload_info = await self.client.call(
-            '_FilesCollectionStart_{}'.format(self.collection_name),
-            {
-                'file': {
-                    'name': self.name,
-                    'type': self.mimetype,
-                    'size': self.filesize,
-                    'meta': self.meta
+        slots = self.uploader._upload_slots
+        
+        try:
+            if slots:
+                async with slots:
+                    await self.__upload__()
+            else:
+                await self.__upload__()
+        
+        except Exception as e:
+            # The source stays open so the upload can be resumed.
+            self.error = e
+        
+        else:
+            self.uploader.uploads.discard(self)
+            self._source.close()
+        
+        self._complete_event.set()
+    
+    async def __upload__(self):
+        # A resumed upload continues with the fileId it was started with.
+        if not self._upload_info:
+            self._upload_info = await self.client.call(
+                '_FilesCollectionStart_{}'.format(self.collection_name),
+                {
+                    'file': {
+                        'name': self.name,
+                        'type': self.mimetype,
+                        'size': self.filesize or 0,
+                        'meta': self.meta
+                    },
+                    'fileId': self._id,
+                    'chunkSize': self.chunk_size,
+                    'fileLength': self.__chunk_count__() if self.filesize is not None else 0
                 },
-                'fileId': self._id,
-                'chunkSize': chunk_size,
-                'fileLength': chunk_count
-            },
-            True
-        )
+                True
+            )
+        
+        upload_info = self._upload_info
         
         parsed = urllib.parse.urlparse(self.client.url)
         upload_uri = '{}://{}{}'.format(
-            'https' if parsed.scheme is 'wss' else 'http',
+            'https' if parsed.scheme == 'wss' else 'http',
             parsed.netloc,
             upload_info['uploadRoute']
         )
         
-        async with aiohttp.ClientSession() as session:
-            for chunk_id in range(chunk_count):
-                chunk = base64.b64encode(self.file.read(chunk_size))
-
-                await session.post(upload_uri, data = chunk, headers = {
-                    'x-eof': '0',
-                    'x-fileId': self._id,
-                    'x-chunkId': str(chunk_id + 1),
-                    'Content-Type': self.mimetype
-                })
-                
-                self.progress = chunk_id / chunk_count
-            
-            await session.post(upload_uri, data = '', headers = {
-                'x-eof': '1',
-                'x-fileId': self._id,
-                'Content-Type': 'text/plain'
-            })
+        session = self.uploader.__session__()
+        
+        if self._source.random_access:
+            # Workers share one iterator of chunk ids, so each chunk is uploaded exactly once while up to self.concurrency chunks are in flight.
+            remaining = [chunk_id for chunk_id in range(self.__chunk_count__()) if chunk_id not in self._acked]
+            chunk_ids = iter(remaining)
+            workers = [
+                self._loop.create_task(self.__upload_chunks__(session, upload_uri, chunk_ids))
+                for i in range(min(self.concurrency, len(remaining)))
+            ]
+        
+        else:
+            retry = collections.OrderedDict(self._unacked)
+            workers = [
+                self._loop.create_task(self.__upload_stream_chunks__(session, upload_uri, retry))
+                for i in range(self.concurrency)
+            ]
+        
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for worker in workers: worker.cancel()
+            raise
+        
+        headers = {
+            'x-eof': '1',
+            'x-fileId': self._id,
+            'Content-Type': 'text/plain'
+        }
+        
+        if self.filesize is None:
+            # The size of a stream is only known once it has been read completely.
+            headers['x-fileSize'] = str(self.uploaded)
+            headers['x-fileLength'] = str(len(self._acked))
+        
+        await self.__post__(session, upload_uri, '', headers)
             
         self.progress = 1
         self.complete = True
-        
-        self.file.close()
@@ -0,0 +1,54 @@
+import collections
+import itertools
+
+def percentile(samples, p):
+    '''Returns the p-th percentile of samples using the nearest-rank method, or None if there are no samples.'''
+    
+    if not samples:
+        return None
+    
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+class Heartbeat:
+    '''Tracks pings sent by the client and the round trip times of the server's pongs.
+    
+    The samples property holds the most recent round trip times, in seconds.
+    The missed property is the number of pings which have not been answered yet.
+    '''
+    
+    def __init__(self, window = 100):
+        self._ids = itertools.count(1)
+        self._pending = collections.OrderedDict()
+        
+        self.samples = collections.deque(maxlen = window)
+    
+    @property
+    def missed(self):
+        return len(self._pending)
+    
+    def percentiles(self, percentiles = (50, 90, 99)):
+        '''Returns a dictionary mapping each of the requested percentiles to a round trip time in seconds.'''
+        return {p: percentile(self.samples, p) for p in percentiles}
+    
+    def __ping__(self, now):
+        '''Records a ping sent at time now, returns the id to send with it.'''
+        
+        _id = str(next(self._ids))
+        self._pending[_id] = now
+        return _id
+    
+    def __pong__(self, _id, now):
+        '''Records a pong received at time now. Pings sent before the answered one are no longer considered missed.'''
+        
+        if _id not in self._pending:
+            return
+        
+        while True:
+            ping_id, sent = self._pending.popitem(last = False)
+            if ping_id == _id:
+                self.samples.append(now - sent)
+                return
+    
+    def __reset__(self):
+        self._pending.clear()
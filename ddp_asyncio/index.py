@@ -0,0 +1,275 @@
+'''Secondary indexes and queries for Collections.
+
+Queries are dictionaries mapping field names to conditions, using a subset of MongoDB's query syntax.
+Field names may use dot-notation to refer to nested fields, i.e. "owner.name".
+A condition is either a value which the field must equal, or a dictionary of operators:
+    $eq, $ne: the field must (not) equal the value.
+    $gt, $gte, $lt, $lte: the field must be greater than / less than the value. Values are only compared with values of the same type.
+    $in, $nin: the field must (not) equal one of the values in a list.
+    $exists: the field must (not) be present.
+As in MongoDB, a condition on a field which contains a list matches if any item of the list matches.
+Queries are checked with validate() when they are given to a Collection, so a query which cannot be matched raises ValueError there rather than when items arrive.
+'''
+
+import bisect
+import datetime
+import numbers
+
+_missing = object()
+
+operators = ('$eq', '$ne', '$gt', '$gte', '$lt', '$lte', '$in', '$nin', '$exists')
+
+class _Max:
+    '''Compares greater than any other value, used to build upper bounds for bisection.'''
+    
+    def __gt__(self, other): return True
+    def __lt__(self, other): return False
+
+_max = _Max()
+
+def get_field(doc, path):
+    '''Returns the value of a possibly nested field, or _missing if it does not exist.'''
+    
+    value = doc
+    for key in path.split('.'):
+        if not isinstance(value, dict) or key not in value:
+            return _missing
+        value = value[key]
+    
+    return value
+
+def sort_key(value):
+    '''Returns a key which orders values of different types consistently, or None if the value cannot be ordered.
+    None sorts first, followed by numbers, strings and datetimes.
+    '''
+    
+    if value is None or value is _missing:
+        return (0, 0)
+    elif isinstance(value, numbers.Number):
+        return (1, value)
+    elif isinstance(value, str):
+        return (2, value)
+    elif isinstance(value, datetime.datetime):
+        return (3, value)
+    
+    return None
+
+def is_operator_condition(condition):
+    return isinstance(condition, dict) and condition and all(key.startswith('$') for key in condition)
+
+def _compare(value, operator, operand):
+    if operator == '$eq':
+        return value == operand
+    elif operator == '$ne':
+        return value != operand
+    elif operator == '$in':
+        return value in operand
+    elif operator == '$nin':
+        return value not in operand
+    
+    a, b = sort_key(value), sort_key(operand)
+    if a is None or b is None or a[0] != b[0]:
+        return False
+    
+    if operator == '$gt':
+        return a > b
+    elif operator == '$gte':
+        return a >= b
+    elif operator == '$lt':
+        return a < b
+    elif operator == '$lte':
+        return a <= b
+
+def _candidates(value):
+    '''Returns the values a condition is checked against, which are the items of a list as well as the list itself.'''
+    
+    if isinstance(value, list):
+        return [value] + value
+    return [None if value is _missing else value]
+
+def match_condition(value, condition):
+    if not is_operator_condition(condition):
+        return any(v == condition for v in _candidates(value))
+    
+    for operator, operand in condition.items():
+        if operator == '$exists':
+            if (value is not _missing) != bool(operand):
+                return False
+        
+        elif operator in ('$ne', '$nin'):
+            # Negated operators must hold for every item, not just one.
+            positive = '$eq' if operator == '$ne' else '$in'
+            if any(_compare(v, positive, operand) for v in _candidates(value)):
+                return False
+        
+        elif operator in operators:
+            if not any(_compare(v, operator, operand) for v in _candidates(value)):
+                return False
+        
+        else:
+            raise ValueError('Unsupported query operator "{}"'.format(operator))
+    
+    return True
+
+def validate(query):
+    '''Raises ValueError if a query is not a dictionary of field names to conditions, or uses an unsupported operator.'''
+    
+    if not isinstance(query, dict):
+        raise ValueError('A query must be a dictionary, not {!r}'.format(query))
+    
+    for path, condition in query.items():
+        if not isinstance(path, str):
+            raise ValueError('Query field names must be strings, not {!r}'.format(path))
+        
+        if not is_operator_condition(condition): continue
+        
+        for operator, operand in condition.items():
+            if operator not in operators:
+                raise ValueError('Unsupported query operator "{}"'.format(operator))
+            
+            if operator in ('$in', '$nin') and not isinstance(operand, (list, tuple, set, frozenset)):
+                raise ValueError('The operand of "{}" must be a list, not {!r}'.format(operator, operand))
+
+def matches(doc, query):
+    '''Returns True if a document matches a query.'''
+    
+    for path, condition in query.items():
+        if not match_condition(get_field(doc, path), condition):
+            return False
+    
+    return True
+
+class HashIndex:
+    '''Maps the values of a field to the _ids of the items containing them, for fast equality and $in queries.'''
+    
+    def __init__(self, field):
+        self.field = field
+        
+        self._entries = {}
+        self._unhashable = set()
+    
+    def __keys__(self, doc):
+        value = get_field(doc, self.field)
+        return value if isinstance(value, list) else [None if value is _missing else value]
+    
+    def add(self, _id, doc):
+        for key in self.__keys__(doc):
+            try:
+                self._entries.setdefault(key, set()).add(_id)
+            except TypeError:
+                self._unhashable.add(_id)
+    
+    def remove(self, _id, doc):
+        for key in self.__keys__(doc):
+            try:
+                ids = self._entries.get(key)
+            except TypeError:
+                self._unhashable.discard(_id)
+                continue
+            
+            if ids is not None:
+                ids.discard(_id)
+                if not ids: del self._entries[key]
+    
+    def lookup(self, condition):
+        '''Returns a set of _ids which may match a condition, or None if this index cannot be used for the condition.
+        The returned set is a superset of the matching _ids, the condition must still be checked against each item.
+        '''
+        
+        if not is_operator_condition(condition):
+            values = [condition]
+        elif '$eq' in condition:
+            values = [condition['$eq']]
+        elif '$in' in condition:
+            values = condition['$in']
+        else:
+            return None
+        
+        ids = set(self._unhashable)
+        for value in values:
+            try:
+                ids.update(self._entries.get(value, ()))
+            except TypeError:
+                return None
+        
+        return ids
+
+class SortedIndex:
+    '''Keeps the values of a field in sorted order, for fast range queries as well as equality queries.'''
+    
+    def __init__(self, field):
+        self.field = field
+        
+        self._entries = []
+        self._unordered = set()
+    
+    def __keys__(self, doc):
+        value = get_field(doc, self.field)
+        return value if isinstance(value, list) else [value]
+    
+    def add(self, _id, doc):
+        for value in self.__keys__(doc):
+            key = sort_key(value)
+            if key is None:
+                self._unordered.add(_id)
+            else:
+                bisect.insort(self._entries, (key, _id))
+    
+    def remove(self, _id, doc):
+        for value in self.__keys__(doc):
+            key = sort_key(value)
+            if key is None:
+                self._unordered.discard(_id)
+                continue
+            
+            i = bisect.bisect_left(self._entries, (key, _id))
+            if i < len(self._entries) and self._entries[i] == (key, _id):
+                del self._entries[i]
+    
+    def __range__(self, lower = None, lower_inclusive = True, upper = None, upper_inclusive = True):
+        lo, hi = 0, len(self._entries)
+        
+        if lower is not None:
+            lo = bisect.bisect_left(self._entries, (lower,) if lower_inclusive else (lower, _max))
+        if upper is not None:
+            hi = bisect.bisect_left(self._entries, (upper, _max) if upper_inclusive else (upper,))
+        
+        return (_id for key, _id in self._entries[lo:hi])
+    
+    def lookup(self, condition):
+        '''Returns a set of _ids which may match a condition, or None if this index cannot be used for the condition.
+        The returned set is a superset of the matching _ids, the condition must still be checked against each item.
+        '''
+        
+        if not is_operator_condition(condition):
+            condition = {'$eq': condition}
+        
+        if '$eq' in condition or '$in' in condition:
+            values = [condition['$eq']] if '$eq' in condition else condition['$in']
+            keys = [sort_key(v) for v in values]
+            if None in keys:
+                return None
+            
+            ids = set(self._unordered)
+            for key in keys:
+                ids.update(self.__range__(key, True, key, True))
+            return ids
+        
+        bounds = [(op, sort_key(condition[op])) for op in ('$gt', '$gte', '$lt', '$lte') if op in condition]
+        if not bounds or any(key is None for op, key in bounds):
+            return None
+        
+        # Range operators only match values of the operand's type, so the range ends at the boundaries of that type.
+        rank = bounds[0][1][0]
+        lower, lower_inclusive = (rank,), True
+        upper, upper_inclusive = (rank + 1,), False
+        
+        for op, key in bounds:
+            if op in ('$gt', '$gte') and key > lower:
+                lower, lower_inclusive = key, op == '$gte'
+            elif op in ('$lt', '$lte') and key < upper:
+                upper, upper_inclusive = key, op == '$lte'
+        
+        ids = set(self._unordered)
+        ids.update(self.__range__(lower, lower_inclusive, upper, upper_inclusive))
+        return ids
@@ -1,25 +1,50 @@
-import asyncio
-import random
+import itertools
 
 from .exceptions import RemoteMethodError
 
+# Method call ids only need to be unique per connection, a process-wide counter guarantees that without collisions.
+_call_ids = itertools.count(1)
+
 class MethodCall:
-    '''An internal representation of a method call'''
+    '''An internal representation of a method call.
+    
+    If wait_for_updated is set the call is only considered complete once both its result and the server's "updated" message have been received,
+    meaning any writes made by the method have already been applied to the client's Collections.
+    '''
     
-    def __init__(self):
-        self._id = str(random.randint(1, 1000000))
-        self._returned = asyncio.Event()
+    def __init__(self, loop, wait_for_updated = False):
+        self._id = str(next(_call_ids))
+        self._future = loop.create_future()
+        self._wait_for_updated = wait_for_updated
+        self._msg = None
+        self._started = None
         
         self._error, self._result = None, None
+        self._has_result = False
+        self._updated = False
     
     async def __wait__(self):
-        await self._returned.wait()
+        await self._future
         
         if self._error:
             raise RemoteMethodError(self._error.get('message', self._error))
         else:
             return self._result
 
-    async def __result__(self, error, result):
+    def __result__(self, error, result):
+        '''Records the method's result. Returns True if the call is now complete.'''
         self._error, self._result = error, result
-        self._returned.set()
+        self._has_result = True
+        return self.__complete__()
+    
+    def __updated__(self):
+        '''Records that the method's writes have been sent. Returns True if the call is now complete.'''
+        self._updated = True
+        return self.__complete__()
+    
+    def __complete__(self):
+        if not self._has_result or (self._wait_for_updated and not self._updated):
+            return False
+        
+        if not self._future.done(): self._future.set_result(None)
+        return True
@@ -0,0 +1,185 @@
+'''Opt-in instrumentation for DDPClient.
+
+Pass a Metrics instance to DDPClient(metrics=...) to collect the following, all times are in seconds:
+    ddp_messages_received_total{type}, ddp_messages_sent_total{type}: messages by DDP message type.
+    ddp_bytes_received_total, ddp_bytes_sent_total: size of the frames.
+    ddp_decode_seconds: time spent decoding each received frame.
+    ddp_dispatch_seconds{type}: time spent handling each received message, by type.
+    ddp_call_seconds{method}, ddp_call_errors_total{method}: method call latency and errors, by method name.
+    ddp_subscription_ready_seconds{name}: time from subscribing to the subscription becoming ready, by publication name.
+    ddp_collection_events_total{collection,type}: CollectionEvents emitted by each Collection.
+    ddp_collection_queue_depth{collection}, ddp_collection_queue_max_depth{collection}: events waiting in the queues of a Collection and its views, sampled when exported.
+
+When no Metrics instance is given the client skips all of this, so there is no cost beyond a few attribute checks.
+'''
+
+import bisect
+import collections
+
+hooks = ('on_message_received', 'on_message_sent', 'on_call_complete', 'on_collection_event')
+
+default_buckets = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class Histogram:
+    '''Counts observations into buckets with fixed upper bounds, as Prometheus histograms do.'''
+    
+    def __init__(self, buckets = default_buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+    
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+    
+    def cumulative(self):
+        '''Returns (upper bound, cumulative count) pairs, the last upper bound is infinity.'''
+        
+        total, result = 0, []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        
+        return result
+
+def _labels(labels):
+    return ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in labels)
+
+def _sort_key(item):
+    '''Orders (name, labels) pairs by their exported text, label values may be None or of mixed types.'''
+    name, labels = item[0]
+    return name, _labels(labels)
+
+def _value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value)
+
+class Metrics:
+    '''Collects counters and histograms describing a DDPClient's activity, and calls hooks as it happens.
+    
+    Hooks are registered with add_hook() and are called with the following arguments:
+        on_message_received(msg, size, decode_time, dispatch_time)
+        on_message_sent(msg, size)
+        on_call_complete(method, latency, error)
+        on_collection_event(collection_name, event)
+    '''
+    
+    def __init__(self, buckets = default_buckets):
+        self.buckets = buckets
+        
+        self.counters = collections.defaultdict(int)
+        self.histograms = {}
+        self.gauges = {}
+        
+        self._hooks = {name: [] for name in hooks}
+    
+    def add_hook(self, name, fn):
+        '''Registers a function to be called for one of the hooks listed above.'''
+        
+        if name not in self._hooks:
+            raise ValueError('Unknown hook "{}", expected one of: {}'.format(name, ', '.join(hooks)))
+        
+        self._hooks[name].append(fn)
+    
+    def remove_hook(self, name, fn):
+        self._hooks[name].remove(fn)
+    
+    def inc(self, name, labels = (), value = 1):
+        '''Increments a counter. Labels are a tuple of (name, value) pairs.'''
+        self.counters[(name, labels)] += value
+    
+    def observe(self, name, value, labels = ()):
+        '''Records a value in a histogram. Labels are a tuple of (name, value) pairs.'''
+        
+        histogram = self.histograms.get((name, labels))
+        if histogram is None:
+            histogram = self.histograms[(name, labels)] = Histogram(self.buckets)
+        
+        histogram.observe(value)
+    
+    def gauge(self, name, fn):
+        '''Registers a gauge, fn is called when exporting and returns a dictionary mapping label tuples to values.'''
+        self.gauges[name] = fn
+    
+    def to_dict(self):
+        '''Exports all metrics as a dictionary of plain values.'''
+        
+        result = {'counters': {}, 'histograms': {}, 'gauges': {}}
+        
+        for (name, labels), value in self.counters.items():
+            result['counters'].setdefault(name, {})[_labels(labels)] = value
+        
+        for (name, labels), histogram in self.histograms.items():
+            result['histograms'].setdefault(name, {})[_labels(labels)] = {
+                'count': histogram.count,
+                'sum': histogram.sum,
+                'buckets': {_value(bound): count for bound, count in histogram.cumulative()}
+            }
+        
+        for name, fn in self.gauges.items():
+            result['gauges'][name] = {_labels(labels): value for labels, value in fn().items()}
+        
+        return result
+    
+    def to_prometheus(self):
+        '''Exports all metrics in the Prometheus text exposition format.'''
+        
+        lines = []
+        
+        def add(kind, name, samples):
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for sample, labels, value in samples:
+                lines.append('{}{{{}}} {}'.format(sample, _labels(labels), _value(value)) if labels else '{} {}'.format(sample, _value(value)))
+        
+        by_name = collections.defaultdict(list)
+        for (name, labels), value in sorted(self.counters.items(), key = _sort_key):
+            by_name[name].append((name, labels, value))
+        for name, samples in by_name.items():
+            add('counter', name, samples)
+        
+        by_name = collections.defaultdict(list)
+        for (name, labels), histogram in sorted(self.histograms.items(), key = _sort_key):
+            for bound, count in histogram.cumulative():
+                by_name[name].append((name + '_bucket', labels + (('le', _value(bound)),), count))
+            by_name[name].append((name + '_sum', labels, histogram.sum))
+            by_name[name].append((name + '_count', labels, histogram.count))
+        for name, samples in by_name.items():
+            add('histogram', name, samples)
+        
+        for name, fn in sorted(self.gauges.items()):
+            add('gauge', name, [(name, labels, value) for labels, value in sorted(fn().items(), key = lambda item: _labels(item[0]))])
+        
+        return '\n'.join(lines) + '\n'
+    
+    def __received__(self, msg, size, decode_time, dispatch_time):
+        _type = msg.get('msg')
+        
+        self.inc('ddp_messages_received_total', (('type', _type),))
+        self.inc('ddp_bytes_received_total', (), size)
+        self.observe('ddp_decode_seconds', decode_time)
+        self.observe('ddp_dispatch_seconds', dispatch_time, (('type', _type),))
+        
+        for fn in self._hooks['on_message_received']: fn(msg, size, decode_time, dispatch_time)
+    
+    def __sent__(self, msg, size):
+        self.inc('ddp_messages_sent_total', (('type', msg.get('msg')),))
+        self.inc('ddp_bytes_sent_total', (), size)
+        
+        for fn in self._hooks['on_message_sent']: fn(msg, size)
+    
+    def __call_complete__(self, method, latency, error):
+        self.observe('ddp_call_seconds', latency, (('method', method),))
+        if error: self.inc('ddp_call_errors_total', (('method', method),))
+        
+        for fn in self._hooks['on_call_complete']: fn(method, latency, error)
+    
+    def __subscription_ready__(self, name, elapsed):
+        self.observe('ddp_subscription_ready_seconds', elapsed, (('name', name),))
+    
+    def __collection_event__(self, collection, event):
+        self.inc('ddp_collection_events_total', (('collection', collection), ('type', event['type'])))
+        
+        for fn in self._hooks['on_collection_event']: fn(collection, event)
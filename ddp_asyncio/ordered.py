@@ -0,0 +1,178 @@
+'''The order of the items of an ordered Collection, as sent by the server with addedBefore and movedBefore messages.
+
+OrderIndex keeps the _ids in an implicit treap: a balanced binary tree ordered by position rather than by key, where each node knows the size of its subtree.
+Inserting or moving an item before another, removing an item and finding an item's position or the item at a position all take O(log n) time,
+so the order is kept up to date without ever being sorted again.
+'''
+
+import random
+
+class _Node:
+    __slots__ = ('_id', 'priority', 'left', 'right', 'parent', 'size')
+    
+    def __init__(self, _id):
+        self._id = _id
+        self.priority = random.random()
+        self.left = self.right = self.parent = None
+        self.size = 1
+
+def _size(node):
+    return node.size if node else 0
+
+def _update(node):
+    node.size = 1 + _size(node.left) + _size(node.right)
+    if node.left: node.left.parent = node
+    if node.right: node.right.parent = node
+    return node
+
+def _split(node, count):
+    '''Splits a tree into the first count nodes and the rest.'''
+    
+    if node is None:
+        return None, None
+    
+    if _size(node.left) < count:
+        right, rest = _split(node.right, count - _size(node.left) - 1)
+        node.right = right
+        if rest: rest.parent = None
+        return _update(node), rest
+    
+    first, left = _split(node.left, count)
+    node.left = left
+    if first: first.parent = None
+    return first, _update(node)
+
+def _merge(first, second):
+    '''Joins two trees, with every node of first coming before every node of second.'''
+    
+    if first is None or second is None:
+        return first or second
+    
+    if first.priority > second.priority:
+        first.right = _merge(first.right, second)
+        return _update(first)
+    
+    second.left = _merge(first, second.left)
+    return _update(second)
+
+class OrderIndex:
+    '''The _ids of an ordered Collection in order. Iterating over it yields the _ids in order, and indexing it with a position or a slice returns _ids.'''
+    
+    def __init__(self, ids = ()):
+        self._nodes = {}
+        self._root = None
+        
+        for _id in ids:
+            self.insert(_id)
+    
+    def __len__(self):
+        return len(self._nodes)
+    
+    def __contains__(self, _id):
+        return _id in self._nodes
+    
+    def __iter__(self):
+        return self.__iter_from__(0)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1: return [self[i] for i in range(start, stop, step)]
+            
+            ids = []
+            for _id in self.__iter_from__(start):
+                if len(ids) >= stop - start: break
+                ids.append(_id)
+            
+            return ids
+        
+        if index < 0: index += len(self)
+        if not 0 <= index < len(self): raise IndexError('position out of range')
+        
+        node = self._root
+        while True:
+            left = _size(node.left)
+            
+            if index < left:
+                node = node.left
+            elif index == left:
+                return node._id
+            else:
+                index -= left + 1
+                node = node.right
+    
+    def __iter_from__(self, position):
+        '''Yields the _ids in order, starting at a position.'''
+        
+        # Walks down to the node at the position, keeping the nodes which come after it on the way, then continues in order.
+        stack = []
+        node = self._root
+        
+        while node:
+            left = _size(node.left)
+            
+            if position < left:
+                stack.append(node)
+                node = node.left
+            elif position == left:
+                stack.append(node)
+                break
+            else:
+                position -= left + 1
+                node = node.right
+        
+        while stack:
+            node = stack.pop()
+            yield node._id
+            
+            node = node.right
+            while node:
+                stack.append(node)
+                node = node.left
+    
+    def index(self, _id):
+        '''Returns the position of an item. Raises KeyError if there is no such item.'''
+        
+        node = self._nodes[_id]
+        position = _size(node.left)
+        
+        while node.parent:
+            if node is node.parent.right:
+                position += _size(node.parent.left) + 1
+            node = node.parent
+        
+        return position
+    
+    def next(self, _id):
+        '''Returns the _id of the item after an item, or None if it is the last one.'''
+        
+        position = self.index(_id) + 1
+        return self[position] if position < len(self) else None
+    
+    def insert(self, _id, before = None):
+        '''Inserts an item before another one, or at the end if before is None or not in the index.'''
+        
+        node = self._nodes[_id] = _Node(_id)
+        position = self.index(before) if before in self._nodes and before != _id else len(self) - 1
+        
+        first, rest = _split(self._root, position)
+        self._root = _merge(_merge(first, node), rest)
+        self._root.parent = None
+    
+    def remove(self, _id):
+        '''Removes an item. Raises KeyError if there is no such item.'''
+        
+        position = self.index(_id)
+        del self._nodes[_id]
+        
+        first, rest = _split(self._root, position)
+        node, rest = _split(rest, 1)
+        
+        self._root = _merge(first, rest)
+        if self._root: self._root.parent = None
+    
+    def move(self, _id, before = None):
+        '''Moves an item before another one, or to the end if before is None.'''
+        
+        self.remove(_id)
+        self.insert(_id, before)
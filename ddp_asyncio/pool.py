@@ -0,0 +1,221 @@
+import asyncio
+import collections.abc
+import itertools
+
+from .ddpclient import DDPClient
+from .collectionqueue import CollectionQueue
+from .exceptions import NotConnectedError
+
+class DDPClientPool:
+    '''Manages several connections to one or more servers, usually replicas of the same Meteor application, and spreads work across them.
+    
+    The urls parameter is a URL or a list of URLs. The pool opens size connections in total, assigned to the URLs in turn; by default there is one connection per URL.
+    Any other keyword arguments, such as codec, auto_reconnect or heartbeat_interval, are passed on to each DDPClient.
+    
+    Method calls are sent over the connected client with the fewest calls in flight. If routing is 'latency', the client with the lowest median heartbeat round trip time is used instead,
+    which requires heartbeat_interval to be set; clients which have not measured a round trip time yet are treated as the slowest.
+    
+    Calls to methods named in sticky_methods are always sent over the same client for as long as it stays connected, so that calls which depend on each other's effects are handled by the same server.
+    sticky_methods may also be True to make every method sticky.
+    
+    Subscriptions are made on the connected client with the fewest subscriptions, unless a client already has an identical subscription, which is then shared, see DDPClient.
+    Collections returned by get_collection() merge the data of every client.
+    
+    The is_connected property is True while at least one client is connected.
+    '''
+    
+    def __init__(self, urls, size = None, event_loop = None, routing = 'least_loaded', sticky_methods = (), **client_options):
+        if isinstance(urls, str): urls = [urls]
+        if routing not in ('least_loaded', 'latency'):
+            raise ValueError('Unknown routing policy {!r}.'.format(routing))
+        
+        self.urls = list(urls)
+        self.routing = routing
+        self.sticky_methods = sticky_methods
+        
+        self._event_loop = event_loop or asyncio.get_event_loop()
+        
+        url_cycle = itertools.cycle(self.urls)
+        self.clients = [DDPClient(next(url_cycle), self._event_loop, **client_options) for i in range(size or len(self.urls))]
+        
+        self._sticky = {}
+        self._sub_clients = {}
+        self._cols = {}
+    
+    @property
+    def is_connected(self):
+        return any(client.is_connected for client in self.clients)
+    
+    async def connect(self):
+        '''This coroutine connects every client in the pool.
+        It blocks until all connections are established, and raises the first exception raised by any client.
+        '''
+        await asyncio.gather(*[client.connect() for client in self.clients])
+    
+    async def disconnect(self):
+        '''Coroutine which disconnects every client in the pool.'''
+        await asyncio.gather(*[client.disconnect() for client in self.clients])
+    
+    async def call(self, method, *params, wait_for_updated = False):
+        '''This coroutine calls a remote method on one of the pool's servers and returns the result, see DDPClient.call().
+        
+        Raises ddp_asyncio.NotConnectedError if no client is connected.
+        '''
+        
+        if self.sticky_methods is True or method in self.sticky_methods:
+            client = self._sticky.get(method)
+            if not client or not client.is_connected:
+                client = self._sticky[method] = self.__route__()
+        else:
+            client = self.__route__()
+        
+        return await client.call(method, *params, wait_for_updated = wait_for_updated)
+    
+    async def subscribe(self, name, *params, bulk = False):
+        '''Coroutine that subscribes to a publication on the connected client with the fewest subscriptions, see DDPClient.subscribe().
+        
+        Raises ddp_asyncio.NotConnectedError if no client is connected.
+        '''
+        
+        clients = self.__connected__()
+        client = next((client for client in clients if client.__shared_sub__(name, params)), None) or min(clients, key = lambda client: len(client._subs))
+        sub = await client.subscribe(name, *params, bulk = bulk)
+        
+        self._sub_clients[sub._id] = client
+        return sub
+    
+    async def subscribe_many(self, subscriptions, bulk = False):
+        '''Coroutine that subscribes to several publications at once, each on the connected client with the fewest subscriptions, see DDPClient.subscribe_many().
+        
+        Raises ddp_asyncio.NotConnectedError if no client is connected.
+        '''
+        
+        subs = []
+        for spec in subscriptions:
+            subs.append(await self.subscribe(*((spec,) if isinstance(spec, str) else spec), bulk = bulk))
+        
+        return subs
+    
+    async def unsubscribe(self, sub):
+        '''Coroutine that unsubscribes from a publication, on the client which made the subscription.'''
+        
+        client = self._sub_clients[sub._id]
+        await client.unsubscribe(sub)
+        
+        # Subscribing again while the subscription lingers finds it through its client.
+        if not sub._refs: del self._sub_clients[sub._id]
+    
+    def document_counts(self, sub):
+        '''Returns the number of items a subscription sent to each Collection, see DDPClient.document_counts().'''
+        return self._sub_clients[sub._id].document_counts(sub)
+    
+    def get_collection(self, name):
+        '''Retrieve a PoolCollection, which merges the Collection of that name from each client. If it does not exist it will be created.'''
+        
+        c = self._cols.get(name)
+        
+        if not c:
+            c = PoolCollection(name, [client.get_collection(name) for client in self.clients])
+            self._cols[name] = c
+        
+        return c
+    
+    def __connected__(self):
+        clients = [client for client in self.clients if client.is_connected]
+        if not clients:
+            raise NotConnectedError('No client in the DDPClientPool is connected to a server.')
+        
+        return clients
+    
+    def __load__(self, client):
+        return len(client._calls) + client.send_queue_depth
+    
+    def __route__(self):
+        '''Chooses the client to send a method call over, according to the routing policy.'''
+        
+        clients = self.__connected__()
+        
+        if self.routing == 'latency':
+            def latency(client):
+                rtt = client.rtt_percentiles((50,))[50]
+                return (rtt is None, rtt or 0, self.__load__(client))
+            
+            return min(clients, key = latency)
+        
+        return min(clients, key = self.__load__)
+
+class PoolCollection(collections.abc.Mapping):
+    '''A read-only view merging the Collections of the same name from every client in a DDPClientPool.
+    
+    It functions like a Collection: items are looked up by _id, and get_queue(), create_index(), find() and find_one() work across all clients.
+    If the same item is published over more than one connection, lookups return the copy from the first client which has it, and its changes are reported once per connection.
+    '''
+    
+    def __init__(self, name, cols):
+        self._name = name
+        self._cols = cols
+    
+    def __getitem__(self, key):
+        for col in self._cols:
+            if key in col._data: return col._data[key]
+        
+        raise KeyError(key)
+    
+    def __contains__(self, key):
+        return any(key in col._data for col in self._cols)
+    
+    def __len__(self):
+        if len(self._cols) == 1: return len(self._cols[0])
+        return len(set().union(*[col._data for col in self._cols]))
+    
+    def __iter__(self):
+        seen = set()
+        for col in self._cols:
+            for key in col._data:
+                if key not in seen:
+                    seen.add(key)
+                    yield key
+    
+    def __bool__(self):
+        return True
+    
+    def __repr__(self):
+        return '<pool collection {}>'.format(self._name)
+    
+    def get_queue(self, maxsize = 0, overflow = 'block', ids = None, types = None, fields = None, query = None):
+        '''Creates and returns a queue which receives CollectionEvents from every client's Collection, see Collection.get_queue().'''
+        
+        q = CollectionQueue(maxsize, overflow, ids, types, fields, query)
+        for col in self._cols: col.__add_queue__(q)
+        return q
+    
+    def create_index(self, field, sorted = False):
+        '''Creates a secondary index on a field in every client's Collection, see Collection.create_index().'''
+        for col in self._cols: col.create_index(field, sorted)
+    
+    def drop_index(self, field):
+        '''Removes the index on a field.'''
+        for col in self._cols: col.drop_index(field)
+    
+    def find(self, query = None):
+        '''Returns a list of the items which match a query, see Collection.find().'''
+        
+        seen = set()
+        docs = []
+        
+        for col in self._cols:
+            for doc in col.find(query):
+                if doc['_id'] not in seen:
+                    seen.add(doc['_id'])
+                    docs.append(doc)
+        
+        return docs
+    
+    def find_one(self, query = None):
+        '''Returns an item which matches a query, or None if no items match.'''
+        
+        for col in self._cols:
+            doc = col.find_one(query)
+            if doc is not None: return doc
+        
+        return None
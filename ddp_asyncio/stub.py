@@ -0,0 +1,45 @@
+class MethodStub:
+    '''Passed to a method stub registered with DDPClient.stub(), to make optimistic writes to the client's Collections.
+    
+    Each write is applied and reported as a CollectionEvent right away. Until the server confirms the method's own writes, its changes to the written items are kept aside,
+    see DDPClient.stub(). Like items sent by the server, the values written must not be modified in place afterwards.
+    '''
+    
+    def __init__(self, client, method_id):
+        self._client = client
+        self._method_id = method_id
+    
+    def get_collection(self, name):
+        '''Returns the client's Collection of that name, see DDPClient.get_collection().'''
+        return self._client.get_collection(name)
+    
+    def insert(self, collection, _id, fields):
+        '''Adds an item to a Collection. Raises KeyError if the Collection already has an item with that _id.'''
+        
+        col = self.get_collection(collection)
+        if _id in col: raise KeyError(_id)
+        
+        self.__write__(col, _id)
+        col.__added__(_id, dict(fields))
+    
+    def update(self, collection, _id, fields, cleared = ()):
+        '''Sets the given top-level fields of an item and removes the keys in cleared, like a changed message. Raises KeyError if there is no such item.'''
+        
+        col = self.get_collection(collection)
+        if _id not in col: raise KeyError(_id)
+        
+        self.__write__(col, _id)
+        col.__changed__(_id, dict(fields), list(cleared))
+    
+    def remove(self, collection, _id):
+        '''Removes an item from a Collection. Raises KeyError if there is no such item.'''
+        
+        col = self.get_collection(collection)
+        if _id not in col: raise KeyError(_id)
+        
+        self.__write__(col, _id)
+        col.__removed__(_id)
+    
+    def __write__(self, col, _id):
+        col.__stub_write__(_id, self._method_id)
+        self._client._stubbed.add(self._method_id)
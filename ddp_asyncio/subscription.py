@@ -1,17 +1,29 @@
 import asyncio
-import random
+import itertools
 
 from .exceptions import SubscriptionError
 
+# Random ids collide once many subscriptions are made at once, like method call ids they come from a process-wide counter.
+_sub_ids = itertools.count(1)
+
 class Subscription:
     '''Tracks the status of a subscription.
     The ready property can be used to determine if a subscription is ready.
     The error property can be used to determine if a subscription encountered an error.
     '''
     
-    def __init__(self, name):
-        self._id = str(random.randint(0, 1000000))
+    def __init__(self, name, params = (), bulk = False):
+        self._id = str(next(_sub_ids))
         self._name = name
+        self._params = params
+        self._bulk = bulk
+        self._started = None
+        
+        # Identical subscriptions share one Subscription, see DDPClient.subscribe(). It is stopped once every subscribe() has been matched by an unsubscribe(),
+        # after the client's linger timeout if it has one.
+        self._key = None
+        self._refs = 1
+        self._linger = None
         
         self.ready = False
         self.error = None
@@ -19,11 +31,21 @@ class Subscription:
         self._ready_event = asyncio.Event()
 
     def __ready__(self):
+        self.ready = True
         self._ready_event.set()
     
     def __error__(self, error):
         self.error = error
         self._ready_event.set()
+    
+    def __message__(self):
+        '''Returns the message which subscribes to this subscription's publication.'''
+        return {
+            'msg': 'sub',
+            'id': self._id,
+            'name': self._name,
+            'params': self._params
+        }
         
     async def wait(self):
         '''This coroutine waits for the subscription to become ready.
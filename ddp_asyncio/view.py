@@ -0,0 +1,391 @@
+'''Views which are derived from a Collection and kept up to date as it changes, without scanning the Collection again.
+
+CollectionView keeps the items matching a filter in sorted order, optionally limited to the first items, see Collection.view().
+Aggregate keeps a value per group of items, such as a count or a sum, see Collection.group_by().
+
+Both are updated synchronously whenever their Collection changes, and report their own changes to queues created with get_queue().
+A view stops being updated once close() is called or it is garbage collected, or once one of its filter, key or value functions raises an exception.
+'''
+
+import asyncio
+import bisect
+import collections.abc
+import weakref
+
+from .collectionqueue import CollectionQueue
+from .dotable import Dotable
+from .index import get_field, sort_key, matches, validate, _missing
+
+# Sorts after every orderable value.
+_unorderable = (4,)
+
+class _Descending:
+    '''Reverses the order of a sort key.'''
+    
+    __slots__ = ('key',)
+    
+    def __init__(self, key):
+        self.key = key
+    
+    def __eq__(self, other):
+        return self.key == other.key
+    
+    def __lt__(self, other):
+        return other.key < self.key
+    
+    def __gt__(self, other):
+        return other.key > self.key
+
+def sort_function(sort):
+    '''Returns a function which computes an item's sort key.
+    
+    sort may be a field name, a list of (field, direction) tuples or a dictionary mapping fields to directions, where a direction of 1 sorts ascending and -1 descending.
+    '''
+    
+    if sort is None:
+        return lambda doc: ()
+    
+    if isinstance(sort, str):
+        sort = [(sort, 1)]
+    elif isinstance(sort, dict):
+        sort = list(sort.items())
+    
+    def key(doc):
+        parts = []
+        for field, direction in sort:
+            part = sort_key(get_field(doc, field)) or _unorderable
+            parts.append(part if direction >= 0 else _Descending(part))
+        
+        return tuple(parts)
+    
+    return key
+
+def filter_function(filter):
+    '''Returns a function which checks if an item passes a filter, which may be a query (see ddp_asyncio.index) or a function.'''
+    
+    if filter is None:
+        return lambda doc: True
+    elif callable(filter):
+        return filter
+    
+    validate(filter)
+    return lambda doc: matches(doc, filter)
+
+def hashable(value):
+    if isinstance(value, list):
+        return tuple(hashable(v) for v in value)
+    elif isinstance(value, dict):
+        return tuple(sorted((k, hashable(v)) for k, v in value.items()))
+    
+    return value
+
+class View:
+    '''Base class of views derived from a Collection.
+    
+    If a function given to a view raises an exception while the Collection changes, the view is closed and the exception is kept in its error property,
+    and passed to the event loop's exception handler. The client keeps handling messages, but the view and its queues receive no further updates.
+    '''
+    
+    # Views are kept in a WeakSet by their Collection, even those which compare equal to a dictionary like Aggregate.
+    __hash__ = object.__hash__
+    
+    def __init__(self, collection):
+        self._collection = collection
+        self._queues = weakref.WeakSet()
+        self.error = None
+        
+        collection._views.add(self)
+    
+    def get_queue(self, maxsize = 0, overflow = 'block', ids = None, types = None, fields = None, query = None):
+        '''Creates and returns a queue which receives a CollectionEvent whenever this view changes. See Collection.get_queue() for the arguments.'''
+        
+        q = CollectionQueue(maxsize, overflow, ids, types, fields, query)
+        self._queues.add(q)
+        return q
+    
+    def close(self):
+        '''Stops updating this view.'''
+        self._collection._views.discard(self)
+    
+    def __fail__(self, error):
+        '''Stops updating this view after one of its functions raised an exception, so the exception does not reach the client's message handler.'''
+        
+        self.error = error
+        self.close()
+        
+        asyncio.get_event_loop().call_exception_handler({
+            'message': 'Exception raised while updating {!r}, it is no longer updated'.format(self),
+            'exception': error
+        })
+    
+    def __emit__(self, data, doc = None):
+        event = self._collection.__event__(data)
+        
+        for q in self._queues:
+            if q.ids is not None and event['_id'] not in q.ids: continue
+            
+            q.__push__(event, doc)
+            
+            # The client waits for blocked view queues like it does for the Collection's own queues.
+            if q.__blocking__(): self._collection._blocked.add(weakref.ref(q))
+    
+    def __update__(self, event, doc):
+        _type = event['type']
+        
+        if _type == 'added' or _type == 'changed':
+            self.__place__(event['_id'], doc, event)
+        
+        elif _type == 'removed':
+            self.__discard__(event['_id'])
+        
+        elif _type == 'batch':
+            data = self._collection._data
+            
+            for _id in event['added']:
+                self.__place__(_id, data[_id], None)
+            for _id in event['removed']:
+                self.__discard__(_id)
+
+class CollectionView(View, collections.abc.Sequence):
+    '''The items of a Collection which pass a filter, in sorted order. Created by Collection.view().
+    
+    A CollectionView works like a read-only list of items, i.e. view[0] is the first item. The ids() method returns the _ids of the items in order.
+    Each change is applied in O(log n) time, plus the time taken to move the entries of the underlying list.
+    
+    If limit is set, the view only contains that many items from the start of the sorted order.
+    
+    Its queues receive these CollectionEvents:
+        added: an item entered the view. Has the properties _id, fields (the whole item) and index, the item's position in the view.
+        changed: an item in the view changed without moving. The Collection's changed event is passed on.
+        moved: an item in the view changed and moved to a different position. Has the properties _id and index.
+        removed: an item left the view. Has the property _id.
+    '''
+    
+    def __init__(self, collection, filter = None, sort = None, limit = None):
+        self._filter = filter_function(filter)
+        self._key = sort_function(sort)
+        self._limit = limit
+        
+        super().__init__(collection)
+        self.__rebuild__()
+    
+    def __rebuild__(self):
+        self._keys = {}
+        self._entries = []
+        
+        for _id, doc in self._collection._data.items():
+            if self._filter(doc):
+                key = self._keys[_id] = self._key(doc)
+                self._entries.append((key, _id))
+        
+        self._entries.sort()
+    
+    def __len__(self):
+        if self._limit is None: return len(self._entries)
+        return min(len(self._entries), self._limit)
+    
+    def __getitem__(self, index):
+        data = self._collection._data
+        
+        if isinstance(index, slice):
+            return [data[self._entries[i][1]] for i in range(*index.indices(len(self)))]
+        
+        if index < 0: index += len(self)
+        if not 0 <= index < len(self): raise IndexError('view index out of range')
+        
+        return data[self._entries[index][1]]
+    
+    def __repr__(self):
+        return '<view of collection {}>'.format(self._collection._name)
+    
+    def ids(self):
+        '''Returns the _ids of the items in this view, in order.'''
+        return [_id for key, _id in self._entries[:len(self)]]
+    
+    def __visible__(self, position):
+        return self._limit is None or position < self._limit
+    
+    def __entered__(self, position):
+        '''Reports the item at a position, which was just moved into the view by another item leaving it.'''
+        
+        if position < len(self._entries):
+            _id = self._entries[position][1]
+            doc = self._collection._data[_id]
+            self.__emit__({'type': 'added', '_id': _id, 'fields': doc, 'index': position}, doc)
+    
+    def __left__(self, position):
+        '''Reports the item at a position, which was just pushed out of the view by another item entering it.'''
+        
+        if position < len(self._entries):
+            _id = self._entries[position][1]
+            self.__emit__({'type': 'removed', '_id': _id}, self._collection._data.get(_id))
+    
+    def __place__(self, _id, doc, event):
+        '''Adds, moves or keeps an added or changed item, depending on whether it passes the filter and where it sorts.'''
+        
+        old = self._keys.get(_id)
+        
+        if not self._filter(doc):
+            if old is not None: self.__discard__(_id)
+            return
+        
+        key = self._key(doc)
+        
+        if old is not None and old == key:
+            position = bisect.bisect_left(self._entries, (key, _id))
+            if event and self.__visible__(position): self.__emit__(event, doc)
+            return
+        
+        if old is not None:
+            old_position = bisect.bisect_left(self._entries, (old, _id))
+            del self._entries[old_position]
+        
+        self._keys[_id] = key
+        position = bisect.bisect_left(self._entries, (key, _id))
+        self._entries.insert(position, (key, _id))
+        
+        was_visible = old is not None and self.__visible__(old_position)
+        visible = self.__visible__(position)
+        
+        if was_visible and visible:
+            if event and event['type'] == 'changed': self.__emit__(event, doc)
+            if position != old_position: self.__emit__({'type': 'moved', '_id': _id, 'index': position}, doc)
+        
+        elif was_visible:
+            self.__emit__({'type': 'removed', '_id': _id}, doc)
+            self.__entered__(self._limit - 1)
+        
+        elif visible:
+            self.__emit__({'type': 'added', '_id': _id, 'fields': doc, 'index': position}, doc)
+            if self._limit is not None: self.__left__(self._limit)
+    
+    def __discard__(self, _id):
+        key = self._keys.pop(_id, None)
+        if key is None: return
+        
+        position = bisect.bisect_left(self._entries, (key, _id))
+        del self._entries[position]
+        
+        if self.__visible__(position):
+            self.__emit__({'type': 'removed', '_id': _id}, self._collection._data.get(_id))
+            if self._limit is not None: self.__entered__(self._limit - 1)
+
+class GroupBy:
+    '''Groups the items of a Collection which pass a filter by the value of a field, or by the result of a function. Created by Collection.group_by().
+    Its methods create Aggregates, which map each group to a value.
+    '''
+    
+    def __init__(self, collection, key, filter = None):
+        if filter is not None and not callable(filter): validate(filter)
+        
+        self._collection = collection
+        self._filter = filter
+        
+        if callable(key):
+            self._key = key
+        else:
+            def group(doc):
+                value = get_field(doc, key)
+                return None if value is _missing else hashable(value)
+            
+            self._key = group
+    
+    def count(self):
+        '''Returns an Aggregate which counts the items in each group.'''
+        return Aggregate(self._collection, self._key, self._filter, lambda doc: 1)
+    
+    def sum(self, field):
+        '''Returns an Aggregate which sums a field of the items in each group. Values which are not numbers count as 0.'''
+        
+        def value(doc):
+            v = get_field(doc, field)
+            return v if isinstance(v, (int, float)) and not isinstance(v, bool) else 0
+        
+        return Aggregate(self._collection, self._key, self._filter, value)
+
+class Aggregate(View, collections.abc.Mapping):
+    '''Maps each group of a GroupBy to a value, such as a count or a sum, and keeps it up to date in O(1) time per change.
+    
+    Groups without any items are left out. Its queues receive CollectionEvents whose _id is the group:
+        added: a group gained its first item. Has the property fields, which contains the group's value as fields.value.
+        changed: a group's value changed. Has the properties fields and cleared, like added.
+        removed: a group lost its last item.
+    '''
+    
+    def __init__(self, collection, key, filter, value):
+        self._group = key
+        self._filter = filter_function(filter)
+        self._value = value
+        
+        super().__init__(collection)
+        self.__rebuild__()
+    
+    def __rebuild__(self):
+        self._members = {}
+        self._values = {}
+        self._sizes = {}
+        
+        for _id, doc in self._collection._data.items():
+            if self._filter(doc): self.__include__(_id, doc, False)
+    
+    def __getitem__(self, group):
+        return self._values[group]
+    
+    def __len__(self):
+        return len(self._values)
+    
+    def __iter__(self):
+        return iter(self._values)
+    
+    def __repr__(self):
+        return '<aggregate of collection {}>'.format(self._collection._name)
+    
+    def __report__(self, group, added = False):
+        self.__emit__({'type': 'added' if added else 'changed', '_id': group, 'fields': Dotable.shallow({'value': self._values[group]}), 'cleared': []})
+    
+    def __include__(self, _id, doc, report = True):
+        group, value = self._members[_id] = (self._group(doc), self._value(doc))
+        
+        size = self._sizes.get(group, 0)
+        self._sizes[group] = size + 1
+        self._values[group] = self._values.get(group, 0) + value
+        
+        if report: self.__report__(group, not size)
+    
+    def __exclude__(self, _id):
+        group, value = self._members.pop(_id)
+        
+        self._sizes[group] -= 1
+        self._values[group] -= value
+        
+        if not self._sizes[group]:
+            del self._sizes[group]
+            del self._values[group]
+            self.__emit__({'type': 'removed', '_id': group})
+        
+        else:
+            self.__report__(group)
+    
+    def __place__(self, _id, doc, event):
+        old = self._members.get(_id)
+        
+        if not self._filter(doc):
+            if old: self.__exclude__(_id)
+            return
+        
+        if old is None:
+            return self.__include__(_id, doc)
+        
+        group, value = self._group(doc), self._value(doc)
+        
+        if group != old[0]:
+            self.__exclude__(_id)
+            self.__include__(_id, doc)
+        
+        elif value != old[1]:
+            self._members[_id] = (group, value)
+            self._values[group] += value - old[1]
+            self.__report__(group)
+    
+    def __discard__(self, _id):
+        if _id in self._members: self.__exclude__(_id)
@@ -35,5 +35,5 @@ setup(
 
     keywords='ddp meteor',
     packages=find_packages(),
-    install_requires=['websockets', 'ejson'],
+    install_requires=['websockets>=10,<14', 'ejson'],
 )
@@ -0,0 +1,23 @@
+import datetime
+
+import pytest
+
+from ddp_asyncio.codec import get_codec, orjson
+
+frame = '{"msg":"added","collection":"c","id":"a","fields":{"at":{"$date":1500000000000},"data":{"$binary":"YWJj"},"big":{"$InfNaN":1},"plain":[1,"$x"]}}'
+
+@pytest.mark.parametrize('name', ['ejson', 'json', pytest.param('orjson', marks = pytest.mark.skipif(not orjson, reason = 'orjson is not installed'))])
+def test_codecs_decode_ejson_alike(name):
+    fields = get_codec(name).loads(frame)['fields']
+    
+    assert fields['at'] == datetime.datetime(2017, 7, 14, 2, 40, tzinfo = datetime.timezone.utc)
+    assert fields['data'] == b'abc'
+    assert fields['big'] == float('inf')
+    assert fields['plain'] == [1, '$x']
+
+@pytest.mark.parametrize('name', ['ejson', 'json', pytest.param('orjson', marks = pytest.mark.skipif(not orjson, reason = 'orjson is not installed'))])
+def test_codecs_round_trip(name):
+    codec = get_codec(name)
+    msg = codec.loads('{"msg":"method","method":"m","params":[{"at":{"$date":1500000000000},"data":{"$binary":"YWJj"}}],"id":"1"}')
+    
+    assert codec.loads(codec.dumps(msg)) == msg
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from ddp_asyncio.collection import Collection
+
+def test_bound_is_reported_but_events_are_not_refused():
+    async def run():
+        col = Collection('items')
+        q = col.get_queue(2)
+        
+        assert q.maxsize == 2 and not q.full()
+        
+        for i in range(3):
+            col.__added__('item{}'.format(i), {'n': i})
+        
+        # The block policy keeps every event and has the client wait for the reader instead.
+        assert q.qsize() == 3 and q.full() and q.__blocking__()
+        
+        assert (await q.get())['_id'] == 'item0'
+        q.get_nowait()
+        assert not q.full() and q._space.is_set()
+    
+    asyncio.run(run())
+
+def test_drop_oldest():
+    async def run():
+        col = Collection('items')
+        q = col.get_queue(2, 'drop_oldest')
+        
+        for i in range(4):
+            col.__added__('item{}'.format(i), {'n': i})
+        
+        assert [q.get_nowait()['_id'] for i in range(q.qsize())] == ['item2', 'item3']
+        assert q.dropped == 2
+    
+    asyncio.run(run())
+
+def test_coalesce_stops_merging_once_read():
+    async def run():
+        col = Collection('items')
+        col.__added__('a', {'n': 0})
+        q = col.get_queue(1, 'coalesce')
+        
+        col.__changed__('a', {'n': 1}, [])
+        col.__changed__('a', {'n': 2}, [])
+        assert q.qsize() == 1 and (await q.get())['fields']['n'] == 2
+        
+        col.__changed__('a', {'n': 3}, [])
+        assert q.qsize() == 1 and q.get_nowait()['fields']['n'] == 3
+    
+    asyncio.run(run())
+
+def test_invalid_query_raises_when_given():
+    '''Queries are checked when a queue is created, rather than raising in the client's message handler when an item arrives.'''
+    
+    async def run():
+        col = Collection('items')
+        
+        for query in ({'name': {'$regex': '^x'}}, {'name': {'$in': 'x'}}, ['name']):
+            with pytest.raises(ValueError):
+                col.get_queue(query = query)
+            with pytest.raises(ValueError):
+                col.find(query)
+        
+        col.__added__('a', {'name': 'x'})
+        assert len(col) == 1
+    
+    asyncio.run(run())
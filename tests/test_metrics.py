@@ -0,0 +1,71 @@
+import asyncio
+
+from ddp_asyncio import DDPClient
+from ddp_asyncio.metrics import Metrics
+
+from benchmarks.fake_server import FakeDDPServer
+
+def test_prometheus_export_with_none_labels():
+    '''Label values of different types, including None, can be exported.'''
+    
+    metrics = Metrics()
+    metrics.inc('ddp_messages_received_total', (('type', None),))
+    metrics.inc('ddp_messages_received_total', (('type', 'added'),))
+    metrics.observe('ddp_dispatch_seconds', 0.001, (('type', None),))
+    metrics.observe('ddp_dispatch_seconds', 0.001, (('type', 'added'),))
+    
+    text = metrics.to_prometheus()
+    
+    assert 'ddp_messages_received_total{type="None"} 1' in text
+    assert 'ddp_messages_received_total{type="added"} 1' in text
+
+def test_queue_depth_includes_id_and_view_queues():
+    async def run():
+        metrics = Metrics()
+        client = DDPClient('ws://127.0.0.1:1/websocket', metrics = metrics)
+        
+        col = client.get_collection('items')
+        by_id = col.get_queue(ids = ['a'])
+        view = col.view()
+        in_view = view.get_queue()
+        
+        col.__added__('a', {'value': 1})
+        col.__added__('b', {'value': 2})
+        
+        assert metrics.gauges['ddp_collection_queue_depth']() == {(('collection', 'items'),): 3}
+        assert metrics.gauges['ddp_collection_queue_max_depth']() == {(('collection', 'items'),): 2}
+        assert by_id.qsize() == 1 and in_view.qsize() == 2
+    
+    asyncio.run(run())
+
+def test_subscription_ready_time_restarts_after_reconnect():
+    '''Resubscribing after a reconnect is timed from when it was resent, not from the original subscribe() call.'''
+    
+    async def run():
+        metrics = Metrics()
+        server = FakeDDPServer(publications = {'items': lambda: [('items', 'a', {'value': 1})]})
+        await server.start()
+        
+        client = DDPClient(server.url, auto_reconnect = True, reconnect_delay = 0.01, metrics = metrics)
+        await client.connect()
+        
+        sub = await client.subscribe('items')
+        await sub.wait()
+        await asyncio.sleep(0.5)
+        
+        await server.drop_connections()
+        await client.disconnection()
+        
+        for i in range(100):
+            await asyncio.sleep(0.05)
+            if client.is_connected and not client._pending: break
+        
+        histogram = metrics.histograms[('ddp_subscription_ready_seconds', (('name', 'items'),))]
+        
+        await client.disconnect()
+        await server.stop()
+        
+        assert histogram.count == 2
+        assert histogram.sum < 0.5
+    
+    asyncio.run(run())
@@ -0,0 +1,10 @@
+import asyncio
+
+from benchmarks.bench_receive import run
+
+def test_receiving_is_not_slowed_by_backed_up_sends():
+    results = asyncio.run(run(10000, 3))
+    fast, slow = results[False], results[True]
+    
+    assert slow['waiting'], 'The client\'s sends did not back up, so the test did not exercise a slow send path.'
+    assert slow['rate'] > fast['rate'] * 0.5, 'Receiving slowed down from {:.0f} to {:.0f} items/s while sending was backed up.'.format(fast['rate'], slow['rate'])
@@ -0,0 +1,77 @@
+import asyncio
+
+from ddp_asyncio import DDPClient
+
+from benchmarks.fake_server import FakeDDPServer
+
+def test_reconnect_retries_after_failed_and_closed_attempts():
+    '''Reconnecting keeps trying when the server answers a connect message with failed, or closes the connection before answering.'''
+    
+    async def run():
+        server = FakeDDPServer()
+        await server.start()
+        
+        client = DDPClient(server.url, auto_reconnect = True, reconnect_delay = 0.01, max_reconnect_delay = 0.05)
+        await client.connect()
+        
+        send = server.__send__
+        refused = []
+        
+        async def refuse(websocket, msg):
+            if msg.get('msg') == 'connected' and len(refused) < 4:
+                refused.append(msg)
+                
+                if len(refused) % 2:
+                    return await send(websocket, {'msg': 'failed', 'version': '1'})
+                else:
+                    return await websocket.close()
+            
+            await send(websocket, msg)
+        
+        server.__send__ = refuse
+        await server.drop_connections()
+        await client.disconnection()
+        
+        for i in range(100):
+            await asyncio.sleep(0.05)
+            if client.is_connected: break
+        
+        connected = client.is_connected
+        
+        await client.disconnect()
+        await server.stop()
+        
+        assert len(refused) == 4
+        assert connected
+    
+    asyncio.run(run())
+
+def test_handler_failure_reconnects():
+    '''An exception raised while handling a message drops the connection instead of leaving it without a handler.'''
+    
+    async def run():
+        server = FakeDDPServer({'echo': lambda value: value})
+        await server.start()
+        
+        client = DDPClient(server.url, auto_reconnect = True, reconnect_delay = 0.01)
+        await client.connect()
+        
+        dispatch = client.__dispatch__
+        
+        def fail(msg):
+            if msg.get('msg') == 'result':
+                client.__dispatch__ = dispatch
+                raise RuntimeError('boom')
+            return dispatch(msg)
+        
+        client.__dispatch__ = fail
+        
+        # The call is resent after reconnecting, and answered then.
+        result = await asyncio.wait_for(client.call('echo', 2), 5)
+        
+        await client.disconnect()
+        await server.stop()
+        
+        assert result == 2
+    
+    asyncio.run(run())
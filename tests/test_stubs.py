@@ -0,0 +1,54 @@
+import asyncio
+
+from ddp_asyncio import DDPClient
+
+from benchmarks.fake_server import FakeDDPServer
+
+def test_stub_reset_after_reconnect_between_result_and_updated():
+    '''A stubbed call which returned, but whose updated message was lost with the connection, is reset to the server's version after reconnecting.'''
+    
+    async def run():
+        state = {'v': 1}
+        
+        def set_value(value):
+            # The server overrides the value the stub wrote.
+            state['v'] = 99
+            return True
+        
+        server = FakeDDPServer({'setValue': set_value}, {'items': lambda: [('items', 'k', dict(state))]})
+        await server.start()
+        
+        client = DDPClient(server.url, auto_reconnect = True, reconnect_delay = 0.05)
+        await client.connect()
+        
+        col = client.get_collection('items')
+        sub = await client.subscribe('items')
+        await sub.wait()
+        
+        client.stub('setValue', lambda stub, value: stub.update('items', 'k', {'v': value}))
+        
+        # Lose the updated message, as if the connection dropped right after the result arrived.
+        dispatch = client.__dispatch__
+        client.__dispatch__ = lambda msg: None if msg.get('msg') == 'updated' else dispatch(msg)
+        
+        await client.call('setValue', 2)
+        assert col['k']['v'] == 2
+        
+        client.__dispatch__ = dispatch
+        await server.drop_connections()
+        await client.disconnection()
+        
+        for i in range(100):
+            await asyncio.sleep(0.05)
+            if client.is_connected and not client._resyncing: break
+        
+        value = col['k']['v']
+        stubbed = set(client._stubbed)
+        
+        await client.disconnect()
+        await server.stop()
+        
+        assert value == 99
+        assert not stubbed and not col._server_docs
+    
+    asyncio.run(run())
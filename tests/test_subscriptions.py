@@ -0,0 +1,38 @@
+import asyncio
+
+from ddp_asyncio import DDPClient
+
+from benchmarks.fake_server import FakeDDPServer
+
+def items(collection, count):
+    return [(collection, '{}{}'.format(collection, i), {'value': i}) for i in range(count)]
+
+def test_document_counts_only_count_unambiguous_items():
+    '''Items are only counted for a subscription if no other subscription was starting when they arrived.'''
+    
+    async def run():
+        server = FakeDDPServer(publications = {'items': items})
+        await server.start()
+        
+        client = DDPClient(server.url)
+        await client.connect()
+        
+        first = await client.subscribe('items', 'a', 30)
+        second = await client.subscribe('items', 'b', 50)
+        await first.wait()
+        await second.wait()
+        
+        alone = await client.subscribe('items', 'c', 20)
+        await alone.wait()
+        
+        counts = [client.document_counts(sub) for sub in (first, second, alone)]
+        
+        await client.disconnect()
+        await server.stop()
+        
+        # The server publishes the first subscription's items while both are starting, and the second's once the first is ready.
+        assert counts[0] == {}
+        assert counts[1] == {'b': 50}
+        assert counts[2] == {'c': 20}
+    
+    asyncio.run(run())
@@ -0,0 +1,60 @@
+import asyncio
+
+from ddp_asyncio import DDPClient
+from ddp_asyncio.extras import MeteorFilesUploader
+
+from benchmarks.fake_server import FakeDDPServer
+
+async def upload(file_or_path, chunk_size, concurrency):
+    '''Uploads a file to a FakeDDPServer and returns the Upload, the uploaded bytes and the server's record of the file.'''
+    
+    server = FakeDDPServer(upload_latency = 0, keep_uploads = True)
+    await server.start()
+    
+    client = DDPClient(server.url)
+    await client.connect()
+    
+    uploader = MeteorFilesUploader(client, 'files', chunk_size = chunk_size, concurrency = concurrency)
+    u = uploader.start_upload(file_or_path, name = 'data.bin', mimetype = 'application/octet-stream')
+    await u._upload_task
+    
+    await uploader.close()
+    await client.disconnect()
+    await server.stop()
+    
+    chunks = server.uploads[u._id]
+    return u, b''.join(chunks[i] for i in sorted(chunks)), server.files[u._id]
+
+def test_stream_with_empty_items():
+    '''Empty items yielded by an async iterator are skipped rather than ending the upload.'''
+    
+    parts = [b'abc', b'defghijklmno', b'', b'pqrstuvwxyz012345']
+    
+    async def stream():
+        for part in parts:
+            yield part
+    
+    u, data, file = asyncio.run(upload(stream(), 8, 2))
+    
+    assert data == b''.join(parts)
+    assert u.complete and u.uploaded == 32
+    assert file['eof'] and file['size'] == 32 and file['length'] == 4
+
+def test_stream_reader():
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(bytes(range(256)) * 3)
+        reader.feed_eof()
+        return await upload(reader, 100, 3)
+    
+    u, data, file = asyncio.run(run())
+    
+    assert data == bytes(range(256)) * 3
+    assert u.complete and file['size'] == 768 and file['length'] == 8
+
+def test_buffer():
+    payload = bytearray(range(256)) * 5
+    u, data, file = asyncio.run(upload(memoryview(payload), 300, 4))
+    
+    assert data == payload
+    assert u.complete and file['eof']
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from ddp_asyncio import DDPClient
+
+from benchmarks.fake_server import FakeDDPServer
+
+def items(count):
+    return [('items', 'item{}'.format(i), {'value': i}) for i in range(count)]
+
+def test_invalid_view_queries_raise_when_given():
+    async def run():
+        client = DDPClient('ws://127.0.0.1:1/websocket')
+        col = client.get_collection('items')
+        col.__added__('a', {'name': 'x'})
+        
+        bad = {'name': {'$regex': '^x'}}
+        
+        with pytest.raises(ValueError):
+            col.view(bad)
+        with pytest.raises(ValueError):
+            col.group_by('name', bad)
+        with pytest.raises(ValueError):
+            col.view().get_queue(query = {'name': {'$in': 'x'}})
+        
+        # None of the rejected views are left behind to be updated by later changes.
+        col.__added__('b', {'name': 'y'})
+        assert len(col) == 2 and not col._views
+    
+    asyncio.run(run())
+
+def test_failing_view_function_does_not_stop_the_client():
+    '''A view whose filter raises is closed and reports the exception, while the client keeps handling messages.'''
+    
+    async def run():
+        server = FakeDDPServer({'echo': lambda value: value}, {'items': items})
+        await server.start()
+        
+        client = DDPClient(server.url)
+        await client.connect()
+        
+        reported = []
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: reported.append(context['exception']))
+        
+        def only_small(doc):
+            if doc['value'] == 5: raise KeyError('boom')
+            return doc['value'] < 3
+        
+        col = client.get_collection('items')
+        view = col.view(only_small, 'value')
+        grouped = col.group_by(lambda doc: 1 // (doc['value'] - 7)).count()
+        
+        sub = await client.subscribe('items', 10)
+        await sub.wait()
+        
+        result = await client.call('echo', 1)
+        connected = client.is_connected
+        
+        await client.disconnect()
+        await server.stop()
+        
+        assert connected and result == 1
+        assert len(col) == 10
+        assert isinstance(view.error, KeyError) and isinstance(grouped.error, ZeroDivisionError)
+        assert reported == [view.error, grouped.error]
+        assert view.ids() == ['item0', 'item1', 'item2']
+    
+    asyncio.run(run())